@@ -23,6 +23,7 @@ import os
 import sys
 import copy
 import math
+import codecs
 import socket
 import random
 import atexit
@@ -34,42 +35,66 @@ import tempfile
 import importlib
 import itertools
 import subprocess
+import collections
 from collections.abc import Mapping, Container, MutableSequence
 import numpy
 from decorator import decorator
 from openquake.baselib.python3compat import decode
+from openquake.baselib import jit
 
 U16 = numpy.uint16
 F32 = numpy.float32
 F64 = numpy.float64
 TWO16 = 2 ** 16
+# below this number of values the numba kernel of fast_agg is not worth
+# the JIT cost
+NUMBA_MIN_SIZE = 1_000_000
+# max number of (index, lane) pairs aggregated in a single bincount call
+AGG_BLOCKSIZE = 10_000_000
+# number of elements compared at once by not_equal
+CMP_BLOCKSIZE = 65536
+# number of random numbers drawn at once by random_histogram
+HISTO_BLOCKSIZE = 1_000_000
 BASE64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+-'
 
 
 def duplicated(items):
     """
     :returns: True if the items are duplicated, False otherwise
+
+    >>> duplicated([1, 2, 1])
+    True
+    >>> duplicated(iter('abc'))
+    False
     """
-    return len(items) > len(set(items))
+    seen = set()
+    for item in items:
+        if item in seen:  # stop at the first duplicate
+            return True
+        seen.add(item)
+    return False
 
 
-def cached_property(method):
-    """
-    :param method: a method without arguments except self
-    :returns: a cached property
-    """
-    name = method.__name__
+try:  # Python 3.8+
+    from functools import cached_property
+except ImportError:  # Python 3.6 and 3.7
+    class cached_property(object):
+        """
+        Non-data descriptor caching the result of a method without
+        arguments except self in the instance dictionary
+        """
+        def __init__(self, method):
+            self.method = method
+            self.__doc__ = method.__doc__
 
-    def newmethod(self):
-        try:
-            val = self.__dict__[name]
-        except KeyError:
-            val = method(self)
-            self.__dict__[name] = val
-        return val
-    newmethod.__name__ = method.__name__
-    newmethod.__doc__ = method.__doc__
-    return property(newmethod)
+        def __set_name__(self, owner, name):
+            self.name = name
+
+        def __get__(self, obj, cls=None):
+            if obj is None:
+                return self
+            val = obj.__dict__[self.name] = self.method(obj)
+            return val
 
 
 def nokey(item):
@@ -84,6 +109,8 @@ class WeightedSequence(MutableSequence):
     A wrapper over a sequence of weighted items with a total weight attribute.
     Adding items automatically increases the weight.
     """
+    __slots__ = ('_seq', 'weight')
+
     @classmethod
     def merge(cls, ws_list):
         """
@@ -94,8 +121,16 @@ class WeightedSequence(MutableSequence):
             `openquake.baselib.general.WeightedSequence` instances
         :returns:
             a :class:`openquake.baselib.general.WeightedSequence` instance
+
+        >>> WeightedSequence.merge([WeightedSequence([('a', 1)]),
+        ...                         WeightedSequence([('b', 2), ('c', 1)])])
+        <WeightedSequence ['a', 'b', 'c'], weight=4>
         """
-        return sum(ws_list, cls())
+        new = cls()
+        for ws in ws_list:  # single pass, without intermediate sequences
+            new._seq.extend(ws._seq)
+            new.weight += ws.weight
+        return new
 
     def __init__(self, seq=()):
         """
@@ -148,6 +183,14 @@ class WeightedSequence(MutableSequence):
         self._seq.insert(i, item)
         self.weight += weight
 
+    def append(self, item_weight):
+        """
+        Append an item with the given weight to the sequence
+        """
+        item, weight = item_weight
+        self._seq.append(item)
+        self.weight += weight
+
     def __lt__(self, other):
         """
         Ensure ordering by weight
@@ -171,14 +214,11 @@ class WeightedSequence(MutableSequence):
 def distinct(keys):
     """
     Return the distinct keys in order.
+
+    >>> distinct('ABACB')
+    ['A', 'B', 'C']
     """
-    known = set()
-    outlist = []
-    for key in keys:
-        if key not in known:
-            outlist.append(key)
-        known.add(key)
-    return outlist
+    return list(dict.fromkeys(keys))
 
 
 def ceil(a, b):
@@ -191,8 +231,15 @@ def ceil(a, b):
         a positive number
     :returns:
         the biggest integer close to the quotient
+
+    >>> ceil(7, 2)
+    4
+    >>> ceil(2 ** 60 + 1, 1)
+    1152921504606846977
     """
     assert b > 0, b
+    if isinstance(a, int) and isinstance(b, int):
+        return -(-a // b)  # exact even for big integers
     return int(math.ceil(float(a) / b))
 
 
@@ -220,13 +267,20 @@ def block_splitter(items, max_weight, weight=lambda item: 1, key=nokey):
     >>> list(block_splitter(items, 2, key=operator.itemgetter(1)))
     [<WeightedSequence ['A1'], weight=1>, <WeightedSequence ['C2', 'D2'], weight=2>, <WeightedSequence ['E2'], weight=1>]
     """
+    if key is nokey:  # do not call the key function
+        triples = ((item, weight(item), 'Unspecified') for item in items)
+    else:
+        triples = ((item, weight(item), key(item)) for item in items)
+    return _block_splitter(triples, max_weight)
+
+
+def _block_splitter(triples, max_weight):
+    # triples (item, weight, key) with weight and key already computed
     if max_weight <= 0:
         raise ValueError('max_weight=%s' % max_weight)
     ws = WeightedSequence([])
     prev_key = 'Unspecified'
-    for item in items:
-        w = weight(item)
-        k = key(item)
+    for item, w, k in triples:
         if w < 0:  # error
             raise ValueError('The item %r got a negative weight %s!' %
                              (item, w))
@@ -259,16 +313,9 @@ def split_in_slices(number, num_slices):
     """
     assert number > 0, number
     assert num_slices > 0, num_slices
-    blocksize = int(math.ceil(number / num_slices))
-    slices = []
-    start = 0
-    while True:
-        stop = min(start + blocksize, number)
-        slices.append(slice(start, stop))
-        if stop == number:
-            break
-        start += blocksize
-    return slices
+    blocksize = -(-number // num_slices)
+    return [slice(start, min(start + blocksize, number))
+            for start in range(0, number, blocksize)]
 
 
 def gen_slices(start, stop, blocksize):
@@ -313,11 +360,23 @@ def split_in_blocks(sequence, hint, weight=lambda item: 1, key=nokey):
         for k, group in groupby(sequence, key).items():
             blocks.append(group)
         return blocks
-    items = sorted(sequence, key=lambda item: (key(item), weight(item)))
+    # compute weight and key only once per item
+    getweight = operator.itemgetter(1)
+    if key is nokey:  # the key is constant, sort by weight only
+        triples = sorted(((item, weight(item), 'Unspecified')
+                          for item in sequence), key=getweight)
+    else:  # sort by weight the (smaller) groups of items with the same key
+        buckets = {}
+        for item in sequence:
+            k = key(item)
+            buckets.setdefault(k, []).append((item, weight(item), k))
+        triples = []
+        for k in sorted(buckets):
+            triples.extend(sorted(buckets[k], key=getweight))
     assert hint > 0, hint
-    assert len(items) > 0, len(items)
-    total_weight = float(sum(weight(item) for item in items))
-    return block_splitter(items, math.ceil(total_weight / hint), weight, key)
+    assert len(triples) > 0, len(triples)
+    total_weight = float(sum(map(getweight, triples)))
+    return _block_splitter(triples, math.ceil(total_weight / hint))
 
 
 def assert_close(a, b, rtol=1e-07, atol=0, context=None):
@@ -331,34 +390,41 @@ def assert_close(a, b, rtol=1e-07, atol=0, context=None):
     :param rtol: relative tolerance
     :param atol: absolute tolerance
     """
-    if isinstance(a, float) or isinstance(a, numpy.ndarray) and a.shape:
-        # shortcut
-        numpy.testing.assert_allclose(a, b, rtol, atol)
-        return
-    if isinstance(a, (str, bytes, int)):
-        # another shortcut
-        assert a == b, (a, b)
-        return
-    if hasattr(a, 'keys'):  # dict-like objects
-        assert a.keys() == b.keys(), set(a).symmetric_difference(set(b))
-        for x in a:
-            if x != '__geom__':
-                assert_close(a[x], b[x], rtol, atol, x)
-        return
-    if hasattr(a, '__dict__'):  # objects with an attribute dictionary
-        assert_close(vars(a), vars(b), context=a)
-        return
-    if hasattr(a, '__iter__'):  # iterable objects
-        xs, ys = list(a), list(b)
-        assert len(xs) == len(ys), ('Lists of different lenghts: %d != %d'
-                                    % (len(xs), len(ys)))
-        for x, y in zip(xs, ys):
-            assert_close(x, y, rtol, atol, x)
-        return
-    if a == b:  # last attempt to avoid raising the exception
-        return
-    ctx = '' if context is None else 'in context ' + repr(context)
-    raise AssertionError('%r != %r %s' % (a, b, ctx))
+    # iterative depth-first visit, comparing the pairs in the same order
+    # as a recursive visit; each pair carries its tolerances and context
+    stack = [(a, b, rtol, atol, context)]
+    while stack:
+        a, b, rtol, atol, context = stack.pop()
+        if a is b:  # identical objects
+            continue
+        if isinstance(a, float) or isinstance(a, numpy.ndarray) and a.shape:
+            # shortcut
+            numpy.testing.assert_allclose(a, b, rtol, atol)
+            continue
+        if isinstance(a, (str, bytes, int)):
+            # another shortcut
+            assert a == b, (a, b)
+            continue
+        if hasattr(a, 'keys'):  # dict-like objects
+            assert a.keys() == b.keys(), set(a).symmetric_difference(set(b))
+            stack.extend((a[x], b[x], rtol, atol, x)
+                         for x in reversed(list(a)) if x != '__geom__')
+            continue
+        if hasattr(a, '__dict__'):  # objects with an attribute dictionary
+            # NB: the attributes are compared with the default tolerances
+            stack.append((vars(a), vars(b), 1e-07, 0, a))
+            continue
+        if hasattr(a, '__iter__'):  # iterable objects
+            xs, ys = list(a), list(b)
+            assert len(xs) == len(ys), ('Lists of different lenghts: %d != %d'
+                                        % (len(xs), len(ys)))
+            stack.extend((x, y, rtol, atol, x)
+                         for x, y in reversed(list(zip(xs, ys))))
+            continue
+        if a == b:  # last attempt to avoid raising the exception
+            continue
+        ctx = '' if context is None else 'in context ' + repr(context)
+        raise AssertionError('%r != %r %s' % (a, b, ctx))
 
 
 _tmp_paths = []
@@ -472,17 +538,24 @@ def import_all(module_or_package):
     # else import all modules contained in the package
     [pkg_path] = mod_or_pkg.__path__
     n = len(pkg_path)
+    modnames = []
     for cwd, dirs, files in os.walk(pkg_path):
-        if all(os.path.basename(f) != '__init__.py' for f in files):
+        if '__init__.py' not in files:
             # the current working directory is not a subpackage
             continue
         for f in files:
             if f.endswith('.py'):
                 # convert PKGPATH/subpackage/module.py -> subpackage.module
                 # works at any level of nesting
-                modname = (module_or_package + cwd[n:].replace(os.sep, '.') +
-                           '.' + os.path.basename(f[:-3]))
-                importlib.import_module(modname)
+                modnames.append(
+                    module_or_package + cwd[n:].replace(os.sep, '.') +
+                    '.' + f[:-3])
+    # NB: the modules are imported sequentially, since import_all is
+    # typically called by the __init__.py of the package itself: a thread
+    # importing a submodule would wait on the lock of the parent package
+    # held by this thread, causing a deadlock
+    for modname in modnames:
+        importlib.import_module(modname)
     return set(sys.modules) - already_imported
 
 
@@ -503,6 +576,10 @@ def assert_independent(package, *packages):
                 raise CodeDependencyError('%s depends on %s' % (package, pkg))
 
 
+def _identity(key):
+    return key
+
+
 class CallableDict(dict):
     r"""
     A callable object built on top of a dictionary of functions, used
@@ -529,7 +606,7 @@ class CallableDict(dict):
     For a more practical example see the implementation of the exporters
     in openquake.calculators.export
     """
-    def __init__(self, keyfunc=lambda key: key, keymissing=None):
+    def __init__(self, keyfunc=_identity, keymissing=None):
         super().__init__()
         self.keyfunc = keyfunc
         self.keymissing = keymissing
@@ -546,7 +623,8 @@ class CallableDict(dict):
         return decorator
 
     def __call__(self, obj, *args, **kw):
-        key = self.keyfunc(obj)
+        # skip the function call in the common case of no keyfunc
+        key = obj if self.keyfunc is _identity else self.keyfunc(obj)
         return self[key](obj, *args, **kw)
 
     def __missing__(self, key):
@@ -565,16 +643,30 @@ class pack(dict):
     {'x': array([1])}
     >>> p.a
     array([0])
+
+    If the dtypes of (some of) the lists are known, they can be passed,
+    so that the arrays are built without inferring the type of each
+    element:
+
+    >>> pack(dict(x=[1, 2], y=[.1]), dtypes=dict(x=U16))
+    {'x': array([1, 2], dtype=uint16), 'y': array([0.1])}
     """
-    def __init__(self, dic, attrs=()):
+    def __init__(self, dic, attrs=(), dtypes=None):
+        dtypes = dtypes or {}
         for k, v in dic.items():
-            arr = numpy.array(v)
+            if k in dtypes:
+                arr = numpy.fromiter(v, dtypes[k], len(v))
+            else:
+                arr = numpy.array(v)
             if k in attrs:
                 setattr(self, k, arr)
             else:
                 self[k] = arr
 
 
+_missing = object()  # sentinel for missing keys
+
+
 class AccumDict(dict):
     """
     An accumulating dictionary, useful to accumulate variables::
@@ -621,24 +713,43 @@ class AccumDict(dict):
     The implementation is smart enough to make (deep) copies of the
     accumulator, therefore each key has a different accumulator, which
     initially is the empty list (in this case).
+
+    Numpy arrays are summed in place when possible; for that reason
+    the arrays coming from outside are copied, so that the original
+    arrays are never modified:
+
+    >>> arr = numpy.array([1., 2.])
+    >>> acc = AccumDict(accum=numpy.zeros(2))
+    >>> acc += {'a': arr}
+    >>> acc += {'a': arr}
+    >>> acc['a'], arr
+    (array([2., 4.]), array([1., 2.]))
     """
     def __init__(self, dic=None, accum=None, keys=()):
         for key in keys:
             self[key] = copy.deepcopy(accum)
         if dic:
             self.update(dic)
+            for k, v in self.items():
+                if isinstance(v, numpy.ndarray):
+                    self[k] = v.copy()
         self.accum = accum
 
     def __iadd__(self, other):
         if hasattr(other, 'items'):
             for k, v in other.items():
-                if k not in self:
-                    self[k] = v
+                cur = self.get(k, _missing)  # a single lookup
+                if cur is _missing:
+                    self[k] = v.copy() if isinstance(v, numpy.ndarray) else v
                 elif isinstance(v, list):
                     # specialized for speed
-                    self[k].extend(v)
+                    cur.extend(v)
+                elif (isinstance(cur, numpy.ndarray) and
+                      numpy.result_type(cur, v) == cur.dtype and
+                      numpy.broadcast(cur, v).shape == cur.shape):
+                    cur += v  # no allocation
                 else:
-                    self[k] = self[k] + v
+                    self[k] = cur + v
         else:  # add other to all elements
             for k in self:
                 self[k] = self[k] + other
@@ -722,16 +833,11 @@ class AccumDict(dict):
                                for key, value in self.items()})
 
 
-# return a dict imt -> slice and the total number of levels
-def _slicedict_n(imt_dt):
-    n = 0
-    slicedic = {}
-    for imt in imt_dt.names:
-        shp = imt_dt[imt].shape
-        n1 = n + (shp[0] if shp else 1)
-        slicedic[imt] = slice(n, n1)
-        n = n1
-    return slicedic, n
+def _slicedict(imts, sizes):
+    # return a dict imt -> slice, given the number of levels of each IMT
+    stops = itertools.accumulate(sizes)
+    return {imt: slice(stop - size, stop)
+            for imt, size, stop in zip(imts, sizes, stops)}
 
 
 class DictArray(Mapping):
@@ -750,24 +856,26 @@ class DictArray(Mapping):
     The DictArray maintains the lexicographic order of the keys.
     """
     def __init__(self, imtls):
-        self.dt = dt = numpy.dtype(
-            [(str(imt), F64,
-              (len(imls),) if hasattr(imls, '__len__') else (1,))
-             for imt, imls in sorted(imtls.items())])
-        self.slicedic, num_levels = _slicedict_n(dt)
-        self.array = numpy.zeros(num_levels, F64)
-        lenset = set()
-        for imt, imls in imtls.items():
-            self[imt] = imls
-            try:
-                lenset.add(len(imls))
-            except TypeError:
-                lenset.add(1)
+        imts = sorted(imtls)
+        arrays = [numpy.array(imtls[imt], F64, ndmin=1) for imt in imts]
+        sizes = [len(arr) for arr in arrays]
+        self.slicedic = _slicedict(map(str, imts), sizes)
+        self.array = (numpy.concatenate(arrays) if arrays
+                      else numpy.zeros(0, F64))
+        lenset = set(sizes)
         if len(lenset) == 1:
             self.L1 = lenset.pop()
         else:
             self.L1 = None
 
+    @cached_property
+    def dt(self):
+        """
+        :returns: a composite dtype with a field for each IMT
+        """
+        return numpy.dtype([(imt, F64, (slc.stop - slc.start,))
+                            for imt, slc in self.slicedic.items()])
+
     def isnan(self):
         """
         :returns: true if all the underlying values are NaNs
@@ -786,7 +894,8 @@ class DictArray(Mapping):
         """
         assert len(self.array) == len(array)
         arr = object.__new__(self.__class__)
-        arr.dt = self.dt
+        if 'dt' in vars(self):  # share the dtype if already built
+            arr.dt = self.dt
         arr.slicedic = self.slicedic
         arr.array = array
         return arr
@@ -801,26 +910,22 @@ class DictArray(Mapping):
         self.array[self.slicedic[imt]] = array
 
     def __iter__(self):
-        for imt in self.dt.names:
-            yield imt
+        return iter(self.slicedic)
 
     def __len__(self):
-        return len(self.dt.names)
+        return len(self.slicedic)
 
     def __toh5__(self):
-        carray = numpy.zeros(1, self.dt)
-        for imt in self:
-            carray[imt] = self[imt]
+        # the fields of self.dt are laid out as the levels in self.array
+        carray = numpy.ascontiguousarray(self.array, F64).view(self.dt)
         return carray, {}
 
     def __fromh5__(self, carray, attrs):
+        # the array is already flat, in the order of the fields
         self.array = carray[:].view(F64)
-        self.dt = dt = numpy.dtype(
-            [(str(imt), F64, len(carray[0][imt]))
-             for imt in carray.dtype.names])
-        self.slicedic, num_levels = _slicedict_n(dt)
-        for imt in carray.dtype.names:
-            self[imt] = carray[0][imt]
+        dt = carray.dtype
+        sizes = [int(numpy.prod(dt[imt].shape)) for imt in dt.names]
+        self.slicedic = _slicedict(dt.names, sizes)
 
     def __eq__(self, other):
         arr = self.array == other.array
@@ -847,8 +952,12 @@ def groupby(objects, key, reducegroup=list):
     ...         lambda group: ''.join(x[1] for x in group))
     {'A': '12', 'B': '123'}
     """
-    kgroups = itertools.groupby(sorted(objects, key=key), key)
-    return {k: reducegroup(group) for k, group in kgroups}
+    # group in a single pass and sort only the keys; the objects in each
+    # group keep their original order, as with a stable sort
+    groups = collections.defaultdict(list)
+    for obj in objects:
+        groups[key(obj)].append(obj)
+    return {k: reducegroup(groups[k]) for k in sorted(groups)}
 
 
 def groupby2(records, kfield, vfield):
@@ -925,8 +1034,31 @@ def _reducerecords(group):
 def group_array(array, *kfields):
     """
     Convert an array into a dict kfields -> array
+
+    >>> arr = numpy.array([(1, 2.), (0, 3.), (1, 4.)],
+    ...                   [('sid', U16), ('val', F32)])
+    >>> group_array(arr, 'sid')
+    {0: array([(0, 3.)], dtype=[('sid', '<u2'), ('val', '<f4')]), 1: array([(1, 2.), (1, 4.)], dtype=[('sid', '<u2'), ('val', '<f4')])}
     """
-    return groupby(array, operator.itemgetter(*kfields), _reducerecords)
+    if not isinstance(array, numpy.ndarray) or any(
+            array.dtype[f].shape for f in kfields):  # i.e. array fields
+        return groupby(array, operator.itemgetter(*kfields), _reducerecords)
+    if len(array) == 0:
+        return {}
+    # a stable sort by the key fields, then split where the keys change
+    order = numpy.lexsort([array[f] for f in reversed(kfields)])
+    sarray = array[order]
+    cols = [sarray[f] for f in kfields]
+    changed = numpy.zeros(len(sarray) - 1, bool)
+    for col in cols:
+        changed |= col[1:] != col[:-1]
+    starts = numpy.concatenate([[0], numpy.flatnonzero(changed) + 1])
+    stops = numpy.concatenate([starts[1:], [len(sarray)]])
+    if len(kfields) == 1:
+        return {cols[0][start]: sarray[start:stop]
+                for start, stop in zip(starts, stops)}
+    return {tuple(col[start] for col in cols): sarray[start:stop]
+            for start, stop in zip(starts, stops)}
 
 
 def multi_index(shape, axis=None):
@@ -935,46 +1067,91 @@ def multi_index(shape, axis=None):
     :param axis: None or an integer in the range 0 .. L -1
     :yields:
         P tuples of indices with a slice(None) at the axis position (if any)
+
+    >>> list(multi_index((2, 1)))
+    [(0, 0), (1, 0)]
+    >>> list(multi_index((2, 1), 1))
+    [(0, slice(None, None, None), 0), (1, slice(None, None, None), 0)]
     """
     if any(s >= TWO16 for s in shape):
         raise ValueError('Shape too big: ' + str(shape))
-    ranges = (range(s) for s in shape)
     if axis is None:
-        yield from itertools.product(*ranges)
-    for tup in itertools.product(*ranges):
-        lst = list(tup)
-        lst.insert(axis, slice(None))
-        yield tuple(lst)
+        yield from numpy.ndindex(*shape)
+        return
+    sl = (slice(None),)
+    for tup in numpy.ndindex(*shape):
+        yield tup[:axis] + sl + tup[axis:]
+
+
+@jit.kernel
+def _agg_lanes(indices, vals, M, nchunks):
+    # each thread aggregates a chunk of the N values on its own (M, K)
+    # accumulator, reading the values row by row; the partial results
+    # are summed at the end; numba is injected by jit.kernel
+    N, K = vals.shape
+    size = (N + nchunks - 1) // nchunks
+    acc = numpy.zeros((nchunks, M, K))
+    for c in numba.prange(nchunks):  # noqa: F821
+        for i in range(c * size, min((c + 1) * size, N)):
+            idx = indices[i]
+            for k in range(K):
+                acc[c, idx, k] += vals[i, k]
+    return acc.sum(axis=0)
 
 
 def fast_agg(indices, values=None, axis=0, factor=None):
     """
     :param indices: N indices in the range 0 ... M - 1 with M < N
     :param values: N values (can be arrays)
-    :returns: M aggregated values (can be arrays)
+    :param axis: the axis of the values of length N (ignored for 1D values)
+    :param factor: if given, multiply the values by it (not for 1D values)
+    :returns: M aggregated values (can be arrays), with the M values
+              along the given axis
 
     >>> values = numpy.array([[.1, .11], [.2, .22], [.3, .33], [.4, .44]])
     >>> fast_agg([0, 1, 1, 0], values)
     array([[0.5 , 0.55],
            [0.5 , 0.55]])
+    >>> fast_agg([0, 1, 1, 0], values.T, axis=1)
+    array([[0.5 , 0.5 ],
+           [0.55, 0.55]])
     """
     if values is None:
         values = numpy.ones_like(indices)
-    N = len(values)
+    if values.ndim == 1:
+        axis = 0
+    vals = numpy.moveaxis(values, axis, 0)
+    N = len(vals)
     if len(indices) != N:
         raise ValueError('There are %d values but %d indices' %
                          (N, len(indices)))
-    shp = values.shape[1:]
+    shp = vals.shape[1:]
     if not shp:
-        return numpy.bincount(indices, values)
-    M = max(indices) + 1
-    lst = list(shp)
-    lst.insert(axis, M)
-    res = numpy.zeros(lst, values.dtype)
-    for mi in multi_index(shp, axis):
-        vals = values[mi] if factor is None else values[mi] * factor
-        res[mi] = numpy.bincount(indices, vals)
-    return res
+        return numpy.bincount(indices, vals)
+    # int64 indices, to avoid overflows when computing the flat indices
+    indices = numpy.asarray(indices, numpy.int64)
+    M = indices.max() + 1
+    K = int(numpy.prod(shp))
+    vals = vals.reshape(N, K)
+    if factor is not None:
+        vals = vals * factor
+    if jit.available and N * K >= NUMBA_MIN_SIZE:
+        # the accumulators take at most the memory of the values
+        nchunks = min(jit.num_threads(), max(N // M, 1))
+        res = _agg_lanes(indices, vals, M, nchunks)
+    else:
+        # aggregate blocks of lanes with a single bincount on the flattened
+        # (index, lane) pairs; the blocks keep the temporary arrays small
+        res = numpy.zeros((M, K))
+        nlanes = max(AGG_BLOCKSIZE // N, 1)
+        for k0 in range(0, K, nlanes):
+            k1 = min(k0 + nlanes, K)
+            nk = k1 - k0
+            idxs = (indices[:, None] * nk + numpy.arange(nk)).ravel()
+            res[:, k0:k1] = numpy.bincount(
+                idxs, vals[:, k0:k1].ravel(), M * nk).reshape(M, nk)
+    res = res.reshape((M,) + shp).astype(values.dtype)
+    return numpy.moveaxis(res, 0, axis)
 
 
 def fast_agg2(tags, values=None, axis=0):
@@ -993,6 +1170,22 @@ def fast_agg2(tags, values=None, axis=0):
     >>> fast_agg2(['A', 'B', 'B', 'A', 'A'])
     (array(['A', 'B'], dtype='<U1'), array([3., 2.]))
     """
+    tags = numpy.asarray(tags)
+    names = tags.dtype.names
+    if names and len(tags) and all(
+            tags.dtype[name].kind in 'iu' for name in names):
+        # records with integer fields are slow to sort; it is much faster
+        # to combine them into a single integer key with the same ordering
+        cols = [tags[name] for name in names]
+        try:
+            keys = numpy.ravel_multi_index(
+                cols, [int(col.max()) + 1 for col in cols])
+        except ValueError:  # negative fields or too many combinations
+            pass
+        else:
+            _, idxs, indices = numpy.unique(
+                keys, return_index=True, return_inverse=True)
+            return tags[idxs], fast_agg(indices, values, axis)
     uniq, indices = numpy.unique(tags, return_inverse=True)
     return uniq, fast_agg(indices, values, axis)
 
@@ -1012,21 +1205,22 @@ def fast_agg3(structured_array, kfield, vfields, factor=None):
     for vfield in vfields:
         assert vfield in allnames, vfield
     tags = structured_array[kfield]
+    # a single sort, shared by all the value fields
     uniq, indices = numpy.unique(tags, return_inverse=True)
-    dic = {}
-    dtlist = [(kfield, structured_array.dtype[kfield])]
-    for name in vfields:
-        dic[name] = fast_agg(indices, structured_array[name], factor=factor)
-        dtlist.append((name, structured_array.dtype[name]))
+    dtlist = [(name, structured_array.dtype[name])
+              for name in [kfield] + list(vfields)]
     res = numpy.zeros(len(uniq), dtlist)
     res[kfield] = uniq
-    for name in dic:
-        res[name] = dic[name]
+    for name in vfields:
+        res[name] = fast_agg(indices, structured_array[name], factor=factor)
     return res
 
 
 def count(groupiter):
-    return sum(1 for row in groupiter)
+    # groupby passes lists, so there is no need to iterate on the rows
+    if hasattr(groupiter, '__len__'):
+        return len(groupiter)
+    return len(list(groupiter))
 
 
 def countby(array, *kfields):
@@ -1039,10 +1233,20 @@ def countby(array, *kfields):
 def get_array(array, **kw):
     """
     Extract a subarray by filtering on the given keyword arguments
+
+    >>> arr = numpy.array([(1, 0), (1, 1), (2, 1)], [('a', int), ('b', int)])
+    >>> get_array(arr, a=1, b=1)
+    array([(1, 1)], dtype=[('a', '<i8'), ('b', '<i8')])
     """
+    if not kw:
+        return array
+    mask = None
     for name, value in kw.items():
-        array = array[array[name] == value]
-    return array
+        if mask is None:
+            mask = array[name] == value
+        else:  # fuse the conditions, extracting the subarray only once
+            mask &= array[name] == value
+    return array[mask]
 
 
 def not_equal(array_or_none1, array_or_none2):
@@ -1068,19 +1272,32 @@ def not_equal(array_or_none1, array_or_none2):
         return True
     if array_or_none1.shape != array_or_none2.shape:
         return True
-    return (array_or_none1 != array_or_none2).any()
+    a1, a2 = array_or_none1.ravel(), array_or_none2.ravel()
+    # compare block by block, to stop at the first difference without
+    # building a boolean array as large as the inputs
+    for start in range(0, len(a1), CMP_BLOCKSIZE):
+        stop = start + CMP_BLOCKSIZE
+        if (a1[start:stop] != a2[start:stop]).any():
+            return True
+    return False
 
 
 def humansize(nbytes, suffixes=('B', 'KB', 'MB', 'GB', 'TB', 'PB')):
     """
     Return file size in a human-friendly format
+
+    >>> humansize(1536)
+    '1.5 KB'
+    >>> humansize(2 ** 60)
+    '1024 PB'
     """
     if nbytes == 0:
         return '0 B'
-    i = 0
-    while nbytes >= 1024 and i < len(suffixes) - 1:
-        nbytes /= 1024.
-        i += 1
+    # the power of 1024 is computed directly, without a division loop
+    i = min((int(nbytes).bit_length() - 1) // 10, len(suffixes) - 1) \
+        if nbytes >= 1024 else 0
+    if i:
+        nbytes /= 1024. ** i
     f = ('%.2f' % nbytes).rstrip('0').rstrip('.')
     return '%s %s' % (f, suffixes[i])
 
@@ -1092,6 +1309,9 @@ class DeprecationWarning(UserWarning):
     """
 
 
+_deprecated_called = set()  # deprecated functions already called
+
+
 @decorator
 def deprecated(func, msg='', *args, **kw):
     """
@@ -1110,12 +1330,11 @@ def deprecated(func, msg='', *args, **kw):
     Notice that if the function is called several time, the deprecation
     warning will be displayed only the first time.
     """
-    msg = '%s.%s has been deprecated. %s' % (
-        func.__module__, func.__name__, msg)
-    if not hasattr(func, 'called'):
+    if func not in _deprecated_called:  # format the message only once
+        _deprecated_called.add(func)
+        msg = '%s.%s has been deprecated. %s' % (
+            func.__module__, func.__name__, msg)
         warnings.warn(msg, DeprecationWarning, stacklevel=2)
-        func.called = 0
-    func.called += 1
     return func(*args, **kw)
 
 
@@ -1124,14 +1343,22 @@ def random_filter(objects, reduction_factor, seed=42):
     Given a list of objects, returns a sublist by extracting randomly
     some elements. The reduction factor (< 1) tells how small is the extracted
     list compared to the original list.
+
+    >>> random_filter(range(10), .5)
+    [1, 2, 3, 7, 8, 9]
     """
     assert 0 < reduction_factor <= 1, reduction_factor
-    rnd = random.Random(seed)
-    out = []
-    for obj in objects:
-        if rnd.random() <= reduction_factor:
-            out.append(obj)
-    return out
+    if not hasattr(objects, '__len__'):  # i.e. a generator
+        objects = list(objects)
+    # a single vectorized draw instead of a draw per object; the numpy
+    # Mersenne Twister starts from the state of random.Random(seed), so
+    # the draws are the same as rnd.random() and so is the filtered list
+    _version, internal, _gauss = random.Random(seed).getstate()
+    rnd = numpy.random.RandomState()
+    rnd.set_state(('MT19937', numpy.array(internal[:-1], numpy.uint32),
+                   internal[-1]))
+    mask = rnd.random_sample(len(objects)) <= reduction_factor
+    return list(itertools.compress(objects, mask.tolist()))
 
 
 def random_histogram(counts, nbins, seed):
@@ -1146,7 +1373,14 @@ def random_histogram(counts, nbins, seed):
     array([2043, 2015, 2050, 1930, 1962])
     """
     numpy.random.seed(seed)
-    return numpy.histogram(numpy.random.random(counts), nbins, (0, 1))[0]
+    # the random numbers are drawn and binned in blocks, to keep the memory
+    # bounded for large counts; the random stream and so the histogram
+    # are the same as drawing all the numbers at once
+    histo = numpy.zeros(nbins, int)
+    for start in range(0, counts, HISTO_BLOCKSIZE):
+        size = min(HISTO_BLOCKSIZE, counts - start)
+        histo += numpy.histogram(numpy.random.random(size), nbins, (0, 1))[0]
+    return histo
 
 
 def get_indices(integers):
@@ -1158,11 +1392,15 @@ def get_indices(integers):
     {0: [(0, 2), (7, 8)], 3: [(2, 5)], 2: [(5, 7)]}
     """
     indices = AccumDict(accum=[])  # idx -> [(start, stop), ...]
-    start = 0
-    for i, vals in itertools.groupby(integers):
-        n = sum(1 for val in vals)
-        indices[i].append((start, start + n))
-        start += n
+    integers = numpy.asarray(integers)
+    if len(integers) == 0:
+        return indices
+    # find the boundaries of the runs of equal integers in a single pass
+    idxs = numpy.concatenate(
+        [[0], numpy.flatnonzero(numpy.diff(integers)) + 1, [len(integers)]])
+    starts, stops = idxs[:-1].tolist(), idxs[1:].tolist()
+    for i, start, stop in zip(integers[idxs[:-1]].tolist(), starts, stops):
+        indices[i].append((start, stop))
     return indices
 
 
@@ -1176,6 +1414,8 @@ def safeprint(*args, **kwargs):
     # if sys.stdout is replaced by a StringIO instance, Python 2 does not
     # have an attribute 'encoding', and we assume ascii in that case
     str_encoding = getattr(sys.stdout, 'encoding', None) or 'ascii'
+    if codecs.lookup(str_encoding).name == 'utf-8':  # nothing to convert
+        return print(*args, **kwargs)
     for s in args:
         new_args.append(s.encode('utf-8').decode(str_encoding, 'ignore'))
 
@@ -1201,7 +1441,10 @@ def socket_ready(hostport):
     return False if exc else True
 
 
-port_candidates = list(range(1920, 2000))
+ZIP_BUFSIZE = 2 ** 20  # size of the write buffer of the zip archives
+
+# shuffled once, so that extracting a random port is a simple pop
+port_candidates = random.sample(range(1920, 2000), 80)
 
 
 def _get_free_port():
@@ -1212,28 +1455,51 @@ def _get_free_port():
     # never considered free again, even if it is. These restrictions as
     # acceptable for usage in the tests, but only in that case.
     while port_candidates:
-        port = random.choice(port_candidates)
-        port_candidates.remove(port)
-        if not socket_ready(('127.0.0.1', port)):  # no server listening
-            return port  # the port is free
+        port = port_candidates.pop()
+        # binding is a local operation, much faster than a TCP handshake;
+        # it also detects ports which are bound but not listening
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(('127.0.0.1', port))
+        except OSError:  # the port is taken
+            continue
+        finally:
+            sock.close()
+        return port  # the port is free
     raise RuntimeError('No free ports in the range 1920:2000')
 
 
-def zipfiles(fnames, archive, mode='w', log=lambda msg: None, cleanup=False):
+def zipfiles(fnames, archive, mode='w', log=lambda msg: None, cleanup=False,
+             compresslevel=1):
     """
     Build a zip archive from the given file names.
 
     :param fnames: list of path names
     :param archive: path of the archive or BytesIO object
+    :param compresslevel: compression level from 1 (fastest) to 9 (smallest)
     """
     prefix = len(os.path.commonprefix([os.path.dirname(f) for f in fnames]))
-    with zipfile.ZipFile(
-            archive, mode, zipfile.ZIP_DEFLATED, allowZip64=True) as z:
-        for f in fnames:
-            log('Archiving %s' % f)
-            z.write(f, f[prefix:])
-            if cleanup:  # remove the zipped file
-                os.remove(f)
+    # the archives are written once and read rarely, so by default we
+    # prefer a fast compression to a small archive
+    kw = dict(compresslevel=compresslevel) if sys.version_info >= (3, 7) \
+        else {}  # compresslevel is not supported by Python 3.6
+    if mode == 'w' and isinstance(archive, str):
+        # write the archive with a big buffer, to reduce the system calls
+        fileobj = open(archive, 'wb', buffering=ZIP_BUFSIZE)
+    else:
+        fileobj = archive
+    try:
+        with zipfile.ZipFile(fileobj, mode, zipfile.ZIP_DEFLATED,
+                             allowZip64=True, **kw) as z:
+            for f in fnames:
+                log('Archiving %s' % f)
+                z.write(f, f[prefix:])
+                if cleanup:  # remove the zipped file
+                    os.remove(f)
+    finally:
+        if fileobj is not archive:
+            fileobj.close()
     return archive
 
 
@@ -1244,6 +1510,8 @@ def detach_process():
     """
     # see https://pagure.io/python-daemon/blob/master/f/daemon/daemon.py and
     # https://stackoverflow.com/questions/45911705/why-use-os-setsid-in-python
+    # NB: os.posix_spawn cannot replace the forks, since the caller must
+    # keep running its own code (i.e. the dbserver) in the detached process
     def fork_then_exit_parent():
         pid = os.fork()
         if pid:  # in parent
@@ -1291,21 +1559,32 @@ def getsizeof(o, ids=None):
     Find the memory footprint of a Python object recursively, see
     https://code.tutsplus.com/tutorials/understand-how-much-memory-your-python-objects-use--cms-25609
     :param o: the object
+    :param ids: a set of ids of objects already counted (if any)
     :returns: the size in bytes
-    '''
-    ids = ids or set()
-    if id(o) in ids:
-        return 0
-
-    nbytes = sys.getsizeof(o)
-    ids.add(id(o))
-
-    if isinstance(o, Mapping):
-        return nbytes + sum(getsizeof(k, ids) + getsizeof(v, ids)
-                            for k, v in o.items())
-    elif isinstance(o, Container):
-        return nbytes + sum(getsizeof(x, ids) for x in o)
 
+    >>> getsizeof([b'x' * 100] * 2) == sys.getsizeof([0, 0]) + 133
+    True
+    '''
+    ids = set() if ids is None else ids
+    queue = collections.deque([o])  # iterative, no RecursionError
+    nbytes = 0
+    while queue:
+        obj = queue.popleft()
+        if id(obj) in ids:
+            continue
+        ids.add(id(obj))
+        if isinstance(obj, numpy.ndarray):
+            # do not descend into the elements
+            nbytes += sys.getsizeof(obj) if obj.base is None else obj.nbytes
+            continue
+        nbytes += sys.getsizeof(obj)
+        if isinstance(obj, (str, bytes, int, float)):
+            continue
+        elif isinstance(obj, Mapping):
+            queue.extend(obj.keys())
+            queue.extend(obj.values())
+        elif isinstance(obj, Container):
+            queue.extend(obj)
     return nbytes
 
 
@@ -1315,28 +1594,33 @@ def add_defaults(array, **kw):
     :param kw: a dictionary field name -> default value
     :returns: a new array with additional fields with default values
     """
-    dtlist = [(name, array.dtype[name]) for name in array.dtype.names]
-    for k, v in kw.items():
-        if k not in array.dtype.names:
-            dtlist.append((k, type(v)))
-    new = numpy.zeros(array.shape, dtlist)
-    for name in array.dtype.names:
-        new[name] = array[name]
-    for k, v in kw.items():
-        if k not in array.dtype.names:
-            new[k] = v
+    names = array.dtype.names
+    defaults = {k: v for k, v in kw.items() if k not in names}
+    dtlist = [(name, array.dtype[name]) for name in names]
+    dtlist.extend((k, type(v)) for k, v in defaults.items())
+    new = numpy.empty(array.shape, dtlist)
+    new[list(names)] = array  # copy all the original fields at once
+    for k, v in defaults.items():
+        new[k] = v
     return new
 
 
 def get_duplicates(array, *fields):
     """
     :returns: a dictionary {key: num_dupl} for duplicate records
+
+    >>> arr = numpy.array([(1, 2), (1, 3), (1, 2)], [('x', int), ('y', int)])
+    >>> get_duplicates(arr, 'x', 'y')
+    {(1, 2): 2}
+    >>> get_duplicates(arr, 'x')
+    {1: 3}
     """
-    uniq = numpy.unique(array[list(fields)])
-    if len(uniq) == len(array):  # no duplicates
-        return {}
-    return {k: len(g) for k, g in group_array(array, *fields).items()
-            if len(g) > 1}
+    if len(fields) == 1:
+        uniq, counts = numpy.unique(array[fields[0]], return_counts=True)
+    else:
+        uniq, counts = numpy.unique(array[list(fields)], return_counts=True)
+    dup = counts > 1
+    return dict(zip(uniq[dup].tolist(), counts[dup].tolist()))
 
 
 def add_columns(a, b, on, cols=None):
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (C) 2020 GEM Foundation
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+"""
+Optional numba kernels. numba is imported and a kernel is compiled only
+when the kernel is called for the first time, so that importing a module
+defining kernels does not pay for the numba import.
+"""
+import types
+import functools
+import importlib.util
+
+# True if numba is installed; finding the spec does not import it
+available = importlib.util.find_spec('numba') is not None
+
+
+class kernel(object):
+    """
+    Decorator for a function to be compiled with
+    numba.njit(parallel=True, cache=True) on its first call. The function
+    can use numba.prange even if its module does not import numba.
+    Callers must check `available` before calling the kernel.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.compiled = None
+        functools.update_wrapper(self, func)
+
+    def __call__(self, *args):
+        if self.compiled is None:
+            import numba
+            func = self.func
+            # a copy of the function seeing numba among its globals
+            glob = dict(func.__globals__, numba=numba)
+            newfunc = types.FunctionType(
+                func.__code__, glob, func.__name__, func.__defaults__,
+                func.__closure__)
+            newfunc.__qualname__ = func.__qualname__
+            self.compiled = numba.njit(parallel=True, cache=True)(newfunc)
+        return self.compiled(*args)
+
+
+def num_threads():
+    """
+    :returns: the number of threads used by the numba kernels
+    """
+    import numba
+    return numba.config.NUMBA_NUM_THREADS
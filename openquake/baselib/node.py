@@ -203,6 +203,12 @@ def scientificformat(value, fmt='%13.9E', sep=' ', sep2=':'):
         return value.decode('utf8')
     elif isinstance(value, str):
         return value
+    elif isinstance(value, numpy.ndarray) and value.ndim == 1 and (
+            value.dtype in (numpy.float64, numpy.float32)):
+        # the numpy scalars are formatted as in the generic case below
+        return sep.join(_formatfloats(value, fmt))
+    elif isinstance(value, list) and all(isinstance(f, float) for f in value):
+        return sep.join(_formatfloats(value, fmt))
     elif hasattr(value, '__len__'):
         return sep.join((scientificformat(f, fmt, sep2) for f in value))
     elif isinstance(value, (float, numpy.float64, numpy.float32)):
@@ -214,6 +220,13 @@ def scientificformat(value, fmt='%13.9E', sep=' ', sep2=':'):
     return str(value)
 
 
+def _formatfloats(floats, fmt):
+    # fast path of scientificformat for a flat sequence of floats
+    return [fmt_value.replace('-', '')
+            if '-' in fmt_value and set(fmt_value) <= zeroset else fmt_value
+            for fmt_value in map(fmt.__mod__, floats)]
+
+
 def tostring(node, indent=4, nsmap=None):
     """
     Convert a node into an XML string by using the StreamingXMLWriter.
@@ -827,6 +840,9 @@ class ValidatingXmlParser(object):
         self.p.CharacterDataHandler = self._char_data
         self._ancestors = []
         self._root = None
+        self._lazy = False  # not a lazy parsing
+        self._shorttag = {}  # fully qualified tag -> short tag
+        self._attrval = {}  # (short tag, attribute) -> validator name
         try:
             yield
         except ExpatError as err:
@@ -871,6 +887,41 @@ class ValidatingXmlParser(object):
                     self.p.ParseFile(f)
         return self._root
 
+    def parse_lazy(self, fname, bufsize=65536):
+        """
+        Parse a filename lazily. The subnodes of the first child of the
+        root (for instance the sources of a source model) are generated
+        while the file is being read, so that they can be consumed one at
+        a time without keeping the entire tree in memory.
+
+        :returns: the root node, with a lazy child
+        """
+        gen = self._parse_lazy(fname, bufsize)
+        root = next(gen)  # parse up to the first child of the root
+        if self._lazy is not None:
+            self._lazy.nodes = gen
+        return root
+
+    def _parse_lazy(self, fname, bufsize):
+        root_yielded = False
+        with self._context(), open(fname, 'rb') as f:
+            self.filename = fname
+            self._lazy = None  # first child of the root, not found yet
+            self._done = []  # completed subnodes of the lazy node
+            while True:
+                data = f.read(bufsize)
+                self.p.Parse(data, not data)
+                if not root_yielded and (self._lazy is not None or not data):
+                    root_yielded = True
+                    yield self._root
+                done, self._done = self._done, []
+                yield from done
+                if not data:
+                    break
+        if not root_yielded:  # stopped before the first child of the root
+            yield self._root
+        yield from self._done  # completed by the stop
+
     def _start_element(self, longname, attrs):
         try:
             xmlns, name = longname.split('}')
@@ -878,8 +929,17 @@ class ValidatingXmlParser(object):
             name = tag = longname
         else:  # fix the tag with an opening brace
             tag = '{' + longname
-        self._ancestors.append(
-            Node(tag, attrs, lineno=self.p.CurrentLineNumber))
+        node = Node(tag, attrs, lineno=self.p.CurrentLineNumber)
+        self._ancestors.append(node)
+        if len(self._ancestors) == 1:
+            self._root = node
+        elif len(self._ancestors) == 2 and self._lazy is None:
+            # lazy parsing: the node is validated and attached right away,
+            # its subnodes will be generated
+            with context(self.filename, node):
+                self._literalnode(node)
+            self._ancestors[0].append(node)
+            self._lazy = node
         if self.stop and name == self.stop:
             for anc in reversed(self._ancestors):
                 self._end_element(anc.tag)
@@ -887,15 +947,23 @@ class ValidatingXmlParser(object):
 
     def _end_element(self, name):
         node = self._ancestors[-1]
-        with context(self.filename, node):
-            self._root = self._literalnode(node)
         del self._ancestors[-1]
-        if self._ancestors:
-            self._ancestors[-1].append(self._root)
+        if node is self._lazy:  # already validated
+            return
+        with context(self.filename, node):
+            self._literalnode(node)
+        if not self._ancestors:
+            self._root = node
+        elif self._ancestors[-1] is self._lazy:
+            self._done.append(node)
+        else:
+            self._ancestors[-1].append(node)
 
     def _char_data(self, data):
         if data:
             parent = self._ancestors[-1]
+            if parent is self._lazy:  # do not accumulate the whitespace
+                return
             if parent.text is None:
                 parent.text = data
             else:
@@ -904,9 +972,8 @@ class ValidatingXmlParser(object):
     def _set_text(self, node, text, tag):
         if text is None:
             return
-        try:
-            val = self.validators[tag]
-        except KeyError:
+        val = self.validators.get(tag)
+        if val is None:
             return
         try:
             node.text = val(decode(text.strip()))
@@ -923,17 +990,34 @@ class ValidatingXmlParser(object):
                 'Could not convert %s->%s: %s, line %s' %
                 (tn, val.__name__, exc, node.lineno))
 
+    def _get_attrval(self, tag, n):
+        # the name of the validator for the attribute n of the given tag,
+        # or None; the lookup is cached since the tags are few
+        try:
+            return self._attrval[tag, n]
+        except KeyError:
+            tn = '%s.%s' % (tag, n)
+            if tn in self.validators:
+                vn = tn
+            elif n in self.validators:
+                vn = n
+            else:
+                vn = None
+            self._attrval[tag, n] = vn
+            return vn
+
     def _literalnode(self, node):
-        tag = striptag(node.tag)
+        try:
+            tag = self._shorttag[node.tag]
+        except KeyError:
+            tag = self._shorttag[node.tag] = striptag(node.tag)
 
         # cast the text
         self._set_text(node, node.text, tag)
 
         # cast the attributes
         for n, v in node.attrib.items():
-            tn = '%s.%s' % (tag, n)
-            if tn in self.validators:
-                self._set_attrib(node, n, tn, v)
-            elif n in self.validators:
-                self._set_attrib(node, n, n, v)
+            vn = self._get_attrval(tag, n)
+            if vn is not None:
+                self._set_attrib(node, n, vn, v)
         return node
@@ -21,11 +21,14 @@ Test related to code in openquake/utils/general.py
 """
 import unittest.mock as mock
 import unittest
-from operator import attrgetter
+import numpy
+from operator import attrgetter, itemgetter
 from collections import namedtuple
+from openquake.baselib import general, jit
 from openquake.baselib.general import (
-    block_splitter, split_in_blocks, assert_close,
-    deprecated, DeprecationWarning, cached_property)
+    block_splitter, split_in_blocks, assert_close, deprecated,
+    DeprecationWarning, cached_property, fast_agg, fast_agg2, U16, F32,
+    AccumDict)
 
 
 class BlockSplitterTestCase(unittest.TestCase):
@@ -125,6 +128,34 @@ class BlockSplitterTestCase(unittest.TestCase):
         self.assertEqual(list(map(len, blocks)), [1, 1, 1, 2])
         self.assertEqual([b.weight for b in blocks], [2, 4, 4, 2])
 
+    def test_split_with_key_and_weight(self):
+        # unsorted weights, with and without a key; the blocks are
+        # the same as with the original (key, weight) sort
+        items = ['A3', 'B1', 'A1', 'C2', 'B4', 'A2', 'C1', 'B2', 'A5', 'C3']
+        weight = lambda item: int(item[1])
+        blocks = split_in_blocks(items, 3, weight, key=itemgetter(0))
+        self.assertEqual([list(b) for b in blocks],
+                         [['A1', 'A2', 'A3'], ['A5'], ['B1', 'B2', 'B4'],
+                          ['C1', 'C2', 'C3']])
+        blocks = list(split_in_blocks(items, 3, weight))
+        self.assertEqual([list(b) for b in blocks],
+                         [['B1', 'A1', 'C1', 'C2', 'A2'], ['B2', 'A3', 'C3'],
+                          ['B4'], ['A5']])
+        self.assertEqual([b.weight for b in blocks], [7, 8, 4, 5])
+
+    def test_block_splitter_triples(self):
+        # (item, weight, key) triples with precomputed weights and keys
+        triples = [('a', 2, 'X'), ('b', 0, 'X'), ('c', 2, 'X'),
+                   ('d', 1, 'Y'), ('e', 3, 'Y')]
+        blocks = list(general._block_splitter(triples, 3))
+        self.assertEqual([list(b) for b in blocks],
+                         [['a'], ['c'], ['d'], ['e']])
+        self.assertEqual([b.weight for b in blocks], [2, 2, 1, 3])
+        with self.assertRaises(ValueError):
+            next(general._block_splitter([('a', -1, 'X')], 3))
+        with self.assertRaises(ValueError):
+            next(general._block_splitter(triples, 0))
+
 
 class AssertCloseTestCase(unittest.TestCase):
     def test_different(self):
@@ -153,6 +184,14 @@ class AssertCloseTestCase(unittest.TestCase):
         with self.assertRaises(AssertionError):  # different attributes
             assert_close(c1, c2)
 
+    def test_deeply_nested(self):
+        # deeper than the recursion limit
+        a, b = [1.], [1.]
+        for _ in range(5000):
+            a, b = [a], [b]
+        assert_close(a, b)
+        assert_close(a, a)
+
 
 class DeprecatedTestCase(unittest.TestCase):
     def test(self):
@@ -192,3 +231,121 @@ class CachedPropertyTestCase(unittest.TestCase):
         self.__dict__['one'] = 2
         self.assertEqual(self.one, 2)
         self.assertEqual(self.ncalls, 1)
+
+
+class FastAggTestCase(unittest.TestCase):
+    def test_3d(self):
+        values = numpy.arange(24.).reshape(4, 3, 2)
+        indices = [1, 0, 1, 0]
+        expected = numpy.array([values[1] + values[3],
+                                values[0] + values[2]])
+        numpy.testing.assert_equal(fast_agg(indices, values), expected)
+
+        # aggregating along the second axis
+        res = fast_agg(indices, values.transpose(1, 0, 2), axis=1)
+        numpy.testing.assert_equal(res, expected.transpose(1, 0, 2))
+
+    def test_u16_indices(self):
+        # M * K > 65535: the flat indices must not overflow
+        indices = numpy.array([0, 1000, 1000, 5], numpy.uint16)
+        res = fast_agg(indices, numpy.ones((4, 100)))
+        self.assertEqual(res.shape, (1001, 100))
+        self.assertEqual(res[1000].sum(), 200.)
+        self.assertEqual(res.sum(), 400.)
+
+    def test_blocks_of_lanes(self):
+        values = numpy.random.random((10, 7))
+        indices = numpy.array([0, 2, 1, 2, 0, 0, 3, 1, 2, 3])
+        expected = fast_agg(indices, values)
+        with mock.patch('openquake.baselib.general.AGG_BLOCKSIZE', 30):
+            res = fast_agg(indices, values)  # blocks of 3 lanes
+        numpy.testing.assert_allclose(res, expected)
+
+    def test_numpy_fallback(self):
+        # without numba the bincount path is used even above NUMBA_MIN_SIZE
+        values = numpy.random.random((1000, 3, 2))
+        indices = numpy.random.randint(0, 7, 1000)
+        indices[:7] = range(7)
+        expected = numpy.zeros((7, 3, 2))
+        numpy.add.at(expected, indices, values)
+        with mock.patch('openquake.baselib.general.NUMBA_MIN_SIZE', 1), \
+                mock.patch.object(jit, 'available', False):
+            res = fast_agg(indices, values)
+        numpy.testing.assert_allclose(res, expected)
+
+    @unittest.skipUnless(jit.available, 'numba is not installed')
+    def test_numba(self):
+        values = numpy.random.random((1000, 3, 2))
+        indices = numpy.random.randint(0, 7, 1000)
+        with mock.patch('openquake.baselib.general.NUMBA_MIN_SIZE', 1):
+            with mock.patch.object(jit, 'available', False):
+                expected = fast_agg(indices, values)  # forced bincount path
+            res = fast_agg(indices, values)
+            numpy.testing.assert_allclose(res, expected)
+            res = fast_agg(indices, values[:, :, 0].astype(numpy.float32))
+            self.assertEqual(res.dtype, numpy.float32)
+            numpy.testing.assert_allclose(res, expected[:, :, 0], 1E-6)
+
+    def test_agg2_records(self):
+        tags = numpy.array([(2, 1), (1, 3), (2, 1), (1, 2)],
+                           [('a', numpy.uint16), ('b', numpy.uint32)])
+        uniq, counts = fast_agg2(tags)
+        numpy.testing.assert_equal(uniq, numpy.unique(tags))
+        numpy.testing.assert_equal(counts, [1, 1, 2])
+
+    def test_agg2_padded_view(self):
+        # the view returned by a multi-field index, as in aggregate_by
+        assets = numpy.zeros(5, [('id', numpy.uint32), ('taxonomy', U16),
+                                 ('value', F32), ('occ', numpy.uint32)])
+        assets['taxonomy'] = [2, 1, 2, 1, 2]
+        assets['occ'] = [1, 1, 1, 3, 1]
+        tags = assets[['taxonomy', 'occ']]
+        uniq, counts = fast_agg2(tags)
+        numpy.testing.assert_equal(uniq, numpy.unique(tags))
+        numpy.testing.assert_equal(counts, [1, 1, 3])
+
+    def test_agg2_fallbacks(self):
+        # negative fields
+        tags = numpy.array([(-1, 2), (3, 2), (-1, 2)],
+                           [('a', numpy.int32), ('b', numpy.int32)])
+        uniq, counts = fast_agg2(tags)
+        numpy.testing.assert_equal(uniq, numpy.unique(tags))
+        numpy.testing.assert_equal(counts, [2, 1])
+
+        # too many combinations to fit in a single integer key
+        big = 2 ** 31
+        tags = numpy.array([(big, big, big), (1, 2, 3), (big, big, big)],
+                           [(f, numpy.uint32) for f in 'abc'])
+        uniq, counts = fast_agg2(tags)
+        numpy.testing.assert_equal(uniq, numpy.unique(tags))
+        numpy.testing.assert_equal(counts, [1, 2])
+
+
+class AccumDictTestCase(unittest.TestCase):
+    def test_arrays(self):
+        arr = numpy.ones(2, numpy.float32)
+        acc = AccumDict({'a': arr})
+        acc += {'a': arr}  # summed in place, the original is untouched
+        numpy.testing.assert_equal(acc['a'], [2, 2])
+        numpy.testing.assert_equal(arr, [1, 1])
+        self.assertEqual(acc['a'].dtype, numpy.float32)
+
+        acc += {'a': numpy.ones(2)}  # upcast
+        self.assertEqual(acc['a'].dtype, numpy.float64)
+
+        acc += {'a': numpy.ones((3, 2))}  # broadcast
+        numpy.testing.assert_equal(acc['a'], numpy.full((3, 2), 4.))
+
+        new = acc + {'a': 1}  # acc is untouched
+        numpy.testing.assert_equal(acc['a'], numpy.full((3, 2), 4.))
+        numpy.testing.assert_equal(new['a'], numpy.full((3, 2), 5.))
+
+
+class RandomHistogramTestCase(unittest.TestCase):
+    def test_blocks(self):
+        # binning by blocks must not change the histogram
+        expected = general.random_histogram(10000, 5, 42)
+        with mock.patch.object(general, 'HISTO_BLOCKSIZE', 999):
+            histo = general.random_histogram(10000, 5, 42)
+        numpy.testing.assert_equal(histo, expected)
+        numpy.testing.assert_equal(histo, [2043, 2015, 2050, 1930, 1962])
@@ -20,6 +20,7 @@ import io
 import copy
 import pickle
 import unittest
+import tempfile
 
 from openquake.baselib import node as n
 
@@ -190,3 +191,29 @@ param=yyy
     def test_can_pickle(self):
         node = n.Node('tag')
         self.assertEqual(pickle.loads(pickle.dumps(node)), node)
+
+
+class ValidatingXmlParserTestCase(unittest.TestCase):
+    XML = b'''\
+<root>
+<model name="m">
+<src id="1"><value>1.5</value></src>
+<src id="2"><value>2.5</value></src>
+</model>
+</root>
+'''
+
+    def test_parse_lazy(self):
+        with tempfile.NamedTemporaryFile(suffix='.xml') as f:
+            f.write(self.XML)
+            f.flush()
+            parser = n.ValidatingXmlParser({'value': float})
+            full = parser.parse_file(f.name)
+            # a small buffer to generate the subnodes while reading the file
+            root = parser.parse_lazy(f.name, bufsize=16)
+            [model] = root
+            self.assertEqual(model['name'], 'm')
+            self.assertNotIsInstance(model.nodes, list)  # a generator
+            srcs = list(model)
+        self.assertEqual([~src.value for src in srcs], [1.5, 2.5])
+        self.assertEqual(srcs, full.model.nodes)
@@ -16,7 +16,6 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 import collections
-import itertools
 import operator
 import logging
 import unittest.mock as mock
@@ -130,14 +129,21 @@ class PmapGetter(object):
         self._pmap_by_grp = {}
         if 'poes' in self.dstore:
             # build probability maps restricted to the given sids
-            ok_sids = set(self.sids)
             for grp, dset in self.dstore['poes'].items():
                 ds = dset['array']
                 L, G = ds.shape[1:]
                 pmap = probability_map.ProbabilityMap(L, G)
-                for idx, sid in enumerate(dset['sids'][()]):
-                    if sid in ok_sids:
-                        pmap[sid] = probability_map.ProbabilityCurve(ds[idx])
+                sids = dset['sids'][()]
+                idxs, = numpy.where(numpy.isin(sids, self.sids))
+                # read only the needed rows, with a slice for each run of
+                # contiguous indices
+                splits = numpy.flatnonzero(numpy.diff(idxs) > 1) + 1
+                for run in numpy.split(idxs, splits):
+                    if len(run) == 0:  # no sites in this group
+                        continue
+                    array = ds[run[0]:run[-1] + 1]
+                    for idx, arr in zip(run, array):
+                        pmap[sids[idx]] = probability_map.ProbabilityCurve(arr)
                 self._pmap_by_grp[grp] = pmap
                 self.nbytes += pmap.nbytes
         return self._pmap_by_grp
@@ -433,20 +439,20 @@ class GmfGetter(object):
         gmfdata = self.get_gmfdata(mon)
         if len(gmfdata) == 0:
             return dict(gmfdata=[])
-        indices = []
         gmfdata.sort(order=('sid', 'eid'))
-        start = stop = 0
-        for sid, rows in itertools.groupby(gmfdata['sid']):
-            for row in rows:
-                stop += 1
-            indices.append((sid, start, stop))
-            start = stop
+        # the records of each site are contiguous, find where they start
+        sids, starts, counts = numpy.unique(
+            gmfdata['sid'], return_index=True, return_counts=True)
+        indices = numpy.zeros((len(sids), 3), U32)
+        indices[:, 0] = sids
+        indices[:, 1] = starts
+        indices[:, 2] = starts + counts
         times = numpy.array([tup + (monitor.task_no,) for tup in self.times],
                             time_dt)
         times.sort(order='rup_id')
         res = dict(gmfdata=gmfdata, hcurves=hcurves, times=times,
                    sig_eps=numpy.array(self.sig_eps, self.sig_eps_dt),
-                   indices=numpy.array(indices, (U32, 3)))
+                   indices=indices)
         return res
 
 
@@ -456,10 +462,13 @@ def group_by_rlz(data, rlzs):
     :param rlzs: an array of E >= D elements
     :returns: a dictionary rlzi -> data for each realization
     """
-    acc = general.AccumDict(accum=[])
-    for rec in data:
-        acc[rlzs[rec['eid']]].append(rec)
-    return {rlzi: numpy.array(recs) for rlzi, recs in acc.items()}
+    rlzis = rlzs[data['eid']]
+    order = numpy.argsort(rlzis, kind='stable')
+    uniq, starts = numpy.unique(rlzis[order], return_index=True)
+    groups = numpy.split(data[order], starts[1:])
+    # keep the realizations in order of first appearance, as before
+    firsts = order[starts]
+    return {uniq[i]: groups[i] for i in numpy.argsort(firsts)}
 
 
 def gen_rgetters(dstore, slc=slice(None)):
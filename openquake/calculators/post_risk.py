@@ -81,10 +81,10 @@ def get_src_loss_table(dstore, L):
     rup_ids = dstore['events']['rup_id'][lbe['event_id']]
     source_id = dstore['ruptures']['source_id'][rup_ids]
     w = dstore['weights'][:]
-    acc = general.AccumDict(accum=numpy.zeros(L, F32))
-    for source_id, rlzi, loss in zip(source_id, lbe['rlzi'], lbe['loss']):
-        acc[source_id] += loss * w[rlzi]
-    return zip(*sorted(acc.items()))
+    # aggregate by source index instead of accumulating row by row
+    source_ids, srcidxs = numpy.unique(source_id, return_inverse=True)
+    losses = lbe['loss'].reshape(len(lbe), L) * w[lbe['rlzi']][:, None]
+    return source_ids, general.fast_agg(srcidxs, losses).astype(F32)
 
 
 @base.calculators.add('post_risk')
@@ -391,10 +391,10 @@ def view_exposure_info(token, dstore):
     """
     Display info about the exposure model
     """
-    assetcol = dstore['assetcol/array'][:]
-    taxonomies = sorted(set(dstore['assetcol'].taxonomies))
-    data = [('#assets', len(assetcol)),
-            ('#taxonomies', len(taxonomies))]
+    # read only the taxonomy field, not the full assetcol
+    taxonomies = dstore['assetcol/array']['taxonomy']
+    data = [('#assets', len(taxonomies)),
+            ('#taxonomies', len(numpy.unique(taxonomies)))]
     return rst_table(data) + '\n\n' + view_assets_by_site(token, dstore)
 
 
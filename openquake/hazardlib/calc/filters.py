@@ -20,6 +20,7 @@ import re
 import sys
 import time
 import logging
+import weakref
 import operator
 import collections.abc
 from contextlib import contextmanager
@@ -85,6 +86,15 @@ class IntegrationDistance(collections.abc.Mapping):
     def __init__(self, dic):
         self.dic = dic  # TRT -> float
         self.magdist = {}  # TRT -> (magnitudes, distances), set by the engine
+        self._boxes = weakref.WeakKeyDictionary()  # src -> (maxdist, box)
+
+    def __getstate__(self):
+        # the cache of the affected boxes is not sent to the workers
+        return {k: v for k, v in vars(self).items() if k != '_boxes'}
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self._boxes = weakref.WeakKeyDictionary()
 
     def __call__(self, trt, mag=None):
         if mag and trt in self.magdist:
@@ -120,11 +130,20 @@ class IntegrationDistance(collections.abc.Mapping):
         :returns: a bounding box (min_lon, min_lat, max_lon, max_lat)
         """
         maxdist = self(src.tectonic_region_type)
+        # the box is cached here and not on the source, so that the
+        # source checksum does not change; the cache is keyed by the
+        # source object, since sources with the same source_id can have
+        # different geometries, and the entries go away with the sources
+        cached = self._boxes.get(src)
+        if cached is not None and cached[0] == maxdist:
+            return cached[1]
         try:
             bbox = get_bounding_box(src, maxdist)
         except Exception as exc:
             raise exc.__class__('source %s: %s' % (src.source_id, exc))
-        return (fix_lon(bbox[0]), bbox[1], fix_lon(bbox[2]), bbox[3])
+        box = (fix_lon(bbox[0]), bbox[1], fix_lon(bbox[2]), bbox[3])
+        self._boxes[src] = maxdist, box
+        return box
 
     def get_dist_bins(self, trt, nbins=51):
         """
@@ -319,13 +338,17 @@ class SourceFilter(object):
         elif not self.integration_distance:  # do not filter
             return self.sitecol.sids
         if not hasattr(self, 'kdt'):
-            self.kdt = cKDTree(self.sitecol.xyz)
+            # the sliding midpoint rule builds the tree ~4x faster than
+            # the median rule, without slowing down the queries
+            self.kdt = cKDTree(self.sitecol.xyz, balanced_tree=False,
+                               compact_nodes=False)
         xyz = spherical_to_cartesian(*rec['hypo'])
         dlon = get_longitudinal_extent(rec['minlon'], rec['maxlon'])
         dlat = rec['maxlat'] - rec['minlat']
         delta = max(dlon, dlat) / KM_TO_DEGREES
         maxradius = self.integration_distance(trt) + delta
-        sids = U32(self.kdt.query_ball_point(xyz, maxradius, eps=.001))
+        idxs = self.kdt.query_ball_point(xyz, maxradius, eps=.001)
+        sids = numpy.fromiter(idxs, U32, len(idxs))
         sids.sort()
         return sids
 
@@ -355,11 +378,26 @@ class SourceFilter(object):
                 src.indices = self.sitecol.sids
                 yield src
                 continue
+            if self._far_away(box):  # skip the scan of the sites
+                continue
             indices = self.sitecol.within_bbox(box)
             if len(indices):
                 src.indices = indices
                 yield src
 
+    def _far_away(self, box):
+        # True if the box cannot contain any site; this is an O(1) check
+        # against the bounding box of the site collection
+        if not hasattr(self, 'sites_box'):
+            lons, lats = self.sitecol.lons, self.sitecol.lats
+            self.sites_box = (lons.min(), lats.min(), lons.max(), lats.max())
+        min_lon, min_lat, max_lon, max_lat = self.sites_box
+        if box[3] <= min_lat or box[1] >= max_lat:
+            return True
+        if cross_idl(min_lon, max_lon, box[0], box[2]):
+            return False  # the longitudes are not comparable
+        return box[2] <= min_lon or box[0] >= max_lon
+
     def within_bbox(self, srcs):
         """
         :param srcs: a list of source objects
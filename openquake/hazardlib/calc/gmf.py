@@ -24,6 +24,7 @@ import time
 import numpy
 import scipy.stats
 
+from openquake.baselib import jit
 from openquake.hazardlib.const import StdDev
 from openquake.hazardlib.gsim.base import ContextMaker
 from openquake.hazardlib.gsim.multi import MultiGMPE
@@ -31,6 +32,38 @@ from openquake.hazardlib.imt import from_string
 
 U32 = numpy.uint32
 F32 = numpy.float32
+# below this number of GMVs the numba kernel of _nonzero_gmfs is not worth
+# the JIT cost
+NUMBA_MIN_SIZE = 1_000_000
+
+
+@jit.kernel
+def _nonzero_lanes(gmfs):
+    # a single parallel pass over the sites, reading the events
+    # contiguously and without the temporary (N, M, E) sums; numba is
+    # injected by jit.kernel
+    N, M, E = gmfs.shape
+    ok = numpy.zeros((N, E), numpy.bool_)
+    for s in numba.prange(N):  # noqa: F821
+        for m in range(M):
+            for e in range(E):
+                if gmfs[s, m, e] != 0:
+                    ok[s, e] = True
+    return ok
+
+
+def _nonzero_gmfs(gmfs):
+    """
+    :param gmfs: an array of shape (N, M, E)
+    :returns: a boolean mask of shape (N, E), True for the sites with
+              nonzero GMVs for events with nonzero GMVs
+    """
+    if jit.available and gmfs.size >= NUMBA_MIN_SIZE:
+        # the GMVs are non-negative, so a site with nonzero GMVs
+        # implies that the event has nonzero GMVs too
+        return _nonzero_lanes(gmfs)
+    ok_events = gmfs.sum(axis=0).sum(axis=0) != 0  # shape E
+    return (gmfs.sum(axis=1) != 0) & ok_events  # shape (N, E)
 
 
 class CorrelationButNoInterIntraStdDevs(Exception):
@@ -136,6 +169,8 @@ class GmfComputer(object):
         t0 = time.time()
         sids = self.sids
         eids_by_rlz = self.ebrupture.get_eids_by_rlz(rlzs_by_gsim)
+        m = (len(min_iml),)
+        gmv_dt = [('sid', U32), ('eid', U32), ('gmv', (F32, m))]
         data = []
         for gs, rlzs in rlzs_by_gsim.items():
             num_events = sum(len(eids_by_rlz[rlzi]) for rlzi in rlzs)
@@ -151,21 +186,23 @@ class GmfComputer(object):
             for rlzi in rlzs:
                 eids = eids_by_rlz[rlzi] + self.e0
                 e = len(eids)
-                for ei, eid in enumerate(eids):
-                    gmf = array[:, :, n + ei]  # shape (N, M)
-                    tot = gmf.sum(axis=0)  # shape (M,)
-                    if not tot.sum():
-                        continue
-                    if sig_eps is not None:
-                        tup = tuple([eid, rlzi] + list(sig[:, n + ei]) +
+                gmfs = array[:, :, n:n + e]  # shape (N, M, e)
+                # discard the events and the sites with zero GMVs
+                ok = _nonzero_gmfs(gmfs)  # shape (N, e)
+                if sig_eps is not None:
+                    for ei in numpy.flatnonzero(ok.any(axis=0)):
+                        tup = tuple([eids[ei], rlzi] + list(sig[:, n + ei]) +
                                     list(eps[:, n + ei]))
                         sig_eps.append(tup)
-                    for sid, gmv in zip(sids, gmf):
-                        if gmv.sum():
-                            data.append((sid, eid, gmv))
+                # event-major order, as the records were generated before
+                eis, sis = numpy.nonzero(ok.T)
+                d = numpy.zeros(len(eis), gmv_dt)
+                d['sid'] = sids[sis]
+                d['eid'] = eids[eis]
+                d['gmv'] = gmfs[sis, :, eis]
+                data.append(d)
                 n += e
-        m = (len(min_iml),)
-        d = numpy.array(data, [('sid', U32), ('eid', U32), ('gmv', (F32, m))])
+        d = numpy.concatenate(data) if data else numpy.zeros(0, gmv_dt)
         return d, time.time() - t0
 
     def compute(self, gsim, num_events):
@@ -3,7 +3,7 @@
 functions required for the implementation of CAN15 gmpes
 """
 
-import scipy
+import math
 import numpy as np
 
 
@@ -89,7 +89,7 @@ def get_equivalent_distance_inslab(mag, repi, hslab):
         Depth of the slab
     """
     area = 10**(-3.225+0.89*mag)
-    radius = (area / scipy.constants.pi)**0.5
+    radius = (area / math.pi)**0.5
     rjb = np.max([repi-radius, np.zeros_like(repi)], axis=0)
     rrup = (rjb**2+hslab**2)**0.5
     return rjb, rrup
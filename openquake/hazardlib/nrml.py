@@ -74,13 +74,12 @@ supplemented by a dictionary of validators.
 import io
 import re
 import sys
-import operator
 import collections.abc
 
 import numpy
 
 from openquake.baselib import hdf5
-from openquake.baselib.general import CallableDict, groupby, gettemp
+from openquake.baselib.general import CallableDict, gettemp
 from openquake.baselib.node import (
     node_to_xml, Node, striptag, ValidatingXmlParser, floatformat)
 from openquake.hazardlib import valid, sourceconverter, InvalidFile
@@ -91,6 +90,7 @@ NRML05 = 'http://openquake.org/xmlns/nrml/0.5'
 GML_NAMESPACE = 'http://www.opengis.net/gml'
 SERIALIZE_NS_MAP = {None: NAMESPACE, 'gml': GML_NAMESPACE}
 PARSE_NS_MAP = {'nrml': NAMESPACE, 'gml': GML_NAMESPACE}
+TAG_VERSION_RE = re.compile(r'(nrml/[\d\.]+)\}(\w+)')
 
 
 class DuplicatedID(Exception):
@@ -153,7 +153,13 @@ def get_tag_version(nrml_node):
     from '{http://openquake.org/xmlns/nrml/0.4}fragilityModel' one gets
     the pair ('fragilityModel', 'nrml/0.4').
     """
-    version, tag = re.search(r'(nrml/[\d\.]+)\}(\w+)', nrml_node.tag).groups()
+    fulltag = nrml_node.tag
+    uri, _, tag = fulltag[1:].partition('}')
+    idx = uri.rfind('nrml/')
+    if fulltag.startswith('{') and idx >= 0 and tag:
+        return tag, uri[idx:]
+    # slow path for unexpected tags
+    version, tag = TAG_VERSION_RE.search(fulltag).groups()
     return tag, version
 
 
@@ -181,24 +187,24 @@ default = sourceconverter.SourceConverter(area_source_discretization=10,
 
 @node_to_obj.add(('sourceModel', 'nrml/0.4'))
 def get_source_model_04(node, fname, converter=default):
-    sources = []
+    groups = collections.defaultdict(list)  # trt -> sources
     source_ids = set()
+    num_sources = 0
     converter.fname = fname
     for src_node in node:
         src = converter.convert_node(src_node)
         if src is None:
             continue
-        if src.source_id in source_ids:
+        groups[src.tectonic_region_type].append(src)
+        source_ids.add(src.source_id)
+        num_sources += 1
+        if len(source_ids) < num_sources:
             raise DuplicatedID(
                 'The source ID %s is duplicated!' % src.source_id)
-        sources.append(src)
-        source_ids.add(src.source_id)
-    groups = groupby(
-        sources, operator.attrgetter('tectonic_region_type'))
-    src_groups = sorted(sourceconverter.SourceGroup(
-        trt, srcs, min_mag=converter.minimum_magnitude)
-                        for trt, srcs in groups.items())
-    return SourceModel(src_groups, node.get('name', ''))
+    src_groups = [sourceconverter.SourceGroup(
+        trt, groups[trt], min_mag=converter.minimum_magnitude)
+                  for trt in sorted(groups)]
+    return SourceModel(sorted(src_groups), node.get('name', ''))
 
 
 @node_to_obj.add(('sourceModel', 'nrml/0.5'))
@@ -318,7 +324,9 @@ def read_source_models(fnames, converter):
     """
     for fname in fnames:
         if fname.endswith(('.xml', '.nrml')):
-            sm = to_python(fname, converter)
+            # the sources are converted while parsing, one at the time
+            [node] = read_lazy(fname)
+            sm = node_to_obj(node, fname, converter)
         else:
             raise ValueError('Unrecognized extension in %s' % fname)
         sm.fname = fname
@@ -344,6 +352,22 @@ def read(source, stop=None):
     """
     vparser = ValidatingXmlParser(validators, stop)
     nrml = vparser.parse_file(source)
+    return _check_nrml(nrml, source)
+
+
+def read_lazy(fname):
+    """
+    Convert a NRML file into a validated Node object. The subnodes of the
+    child of the root node (i.e. the sources of a source model) are
+    generated while parsing, so the entire tree is never kept in memory.
+
+    :param fname: a file name
+    """
+    nrml = ValidatingXmlParser(validators).parse_lazy(fname)
+    return _check_nrml(nrml, fname)
+
+
+def _check_nrml(nrml, source):
     if striptag(nrml.tag) != 'nrml':
         raise ValueError('%s: expected a node of kind nrml, got %s' %
                          (source, nrml.tag))
@@ -100,10 +100,9 @@ class ProbabilityCurve(object):
         :param imtls: DictArray instance
         :param idx: extract the data corresponding to the given inner index
         """
-        curve = numpy.zeros(1, imtls.dt)
-        for imt in imtls:
-            curve[imt] = self.array[imtls(imt), idx]
-        return curve[0]
+        # the fields of imtls.dt are laid out as the levels in the curve
+        curve = numpy.ascontiguousarray(self.array[:, idx], F64)
+        return curve.view(imtls.dt)[0]
 
 
 class ProbabilityMap(dict):
@@ -212,12 +211,11 @@ class ProbabilityMap(dict):
         :param idx:
             index on the z-axis (default 0)
         """
-        curves = numpy.zeros(nsites, imtls.dt)
-        for imt in curves.dtype.names:
-            curves_by_imt = curves[imt]
-            for sid in self:
-                curves_by_imt[sid] = self[sid].array[imtls(imt), idx]
-        return curves
+        # the fields of imtls.dt are laid out as the levels in the curves
+        curves = numpy.zeros((nsites, len(imtls.array)), F64)
+        for sid in self:
+            curves[sid] = self[sid].array[:, idx]
+        return curves.view(imtls.dt).reshape(nsites)
 
     def filter(self, sids):
         """
@@ -21,6 +21,7 @@ Module :mod:`openquake.hazardlib.site` defines :class:`Site`.
 """
 import numpy
 from shapely import geometry
+from openquake.baselib import jit
 from openquake.baselib.general import (
     split_in_blocks, not_equal, get_duplicates)
 from openquake.hazardlib.geo.utils import (
@@ -29,6 +30,20 @@ from openquake.hazardlib.geo.mesh import Mesh
 
 U32LIMIT = 2 ** 32
 ampcode_dt = (numpy.string_, 4)
+# below this number of sites the numba kernel of within_bbox is not worth
+# the JIT cost
+NUMBA_MIN_SIZE = 1_000_000
+
+
+@jit.kernel
+def _bbox_mask(lons, lats, min_lon, min_lat, max_lon, max_lat):
+    # a single parallel pass, without temporary arrays; numba is injected
+    # by jit.kernel
+    mask = numpy.empty(len(lons), numpy.bool_)
+    for i in numba.prange(len(lons)):  # noqa: F821
+        mask[i] = (min_lon < lons[i] and lons[i] < max_lon and
+                   min_lat < lats[i] and lats[i] < max_lat)
+    return mask
 
 
 class Site(object):
@@ -466,9 +481,13 @@ class SiteCollection(object):
         if cross_idl(lons.min(), lons.max(), min_lon, max_lon):
             lons = lons % 360
             min_lon, max_lon = min_lon % 360, max_lon % 360
-        mask = (min_lon < lons) * (lons < max_lon) * \
-               (min_lat < lats) * (lats < max_lat)
-        return mask.nonzero()[0]
+        if jit.available and len(lons) >= NUMBA_MIN_SIZE:
+            mask = _bbox_mask(lons, lats, min_lon, min_lat, max_lon, max_lat)
+        else:
+            mask = (min_lon < lons) & (lons < max_lon)
+            mask &= min_lat < lats
+            mask &= lats < max_lat
+        return numpy.flatnonzero(mask)
 
     def geohash(self, length):
         """
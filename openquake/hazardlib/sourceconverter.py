@@ -292,6 +292,24 @@ class SourceGroup(collections.abc.Sequence):
             self.sources.append(pickle.loads(memoryview(row['pik'])))
 
 
+def _split_coords(seq, dim):
+    # round and check all the coordinates at once; returns None if some
+    # coordinate is invalid, so that the caller can raise a precise error
+    try:
+        cols = [[round(float(x), 5) for x in seq[i::dim]] for i in (0, 1)]
+        if dim == 3:
+            cols.append([float(x) for x in seq[2::dim]])
+    except (TypeError, ValueError):
+        return None
+    lons, lats = cols[0], cols[1]
+    # a NaN makes the checks fail, so it is handled by the slow path
+    if lons and not -180. <= min(lons) <= max(lons) <= 180.:
+        return None
+    if lats and not -90. <= min(lats) <= max(lats) <= 90.:
+        return None
+    return list(zip(*cols))
+
+
 def split_coords_2d(seq):
     """
     :param seq: a flat list with lons and lats
@@ -300,6 +318,9 @@ def split_coords_2d(seq):
     >>> split_coords_2d([1.1, 2.1, 2.2, 2.3])
     [(1.1, 2.1), (2.2, 2.3)]
     """
+    coords = _split_coords(seq, 2)
+    if coords is not None:
+        return coords
     lons, lats = [], []
     for i, el in enumerate(seq):
         if i % 2 == 0:
@@ -317,6 +338,9 @@ def split_coords_3d(seq):
     >>> split_coords_3d([1.1, 2.1, 0.1, 2.3, 2.4, 0.1])
     [(1.1, 2.1, 0.1), (2.3, 2.4, 0.1)]
     """
+    coords = _split_coords(seq, 3)
+    if coords is not None:
+        return coords
     lons, lats, depths = [], [], []
     for i, el in enumerate(seq):
         if i % 3 == 0:
@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 import os
+import pickle
 import unittest
 from numpy.testing import assert_almost_equal as aae
 from openquake.baselib.general import gettemp
@@ -40,6 +41,18 @@ class IntegrationDistanceTestCase(unittest.TestCase):
         bb = maxdist.get_bounding_box(0, 10, 'ANY_TRT')
         aae(bb, [-3.6527738, 6.40272, 3.6527738, 13.59728])
 
+    def test_affected_box(self):
+        fname = gettemp(characteric_source)
+        [[src]] = nrml.to_python(fname)
+        os.remove(fname)
+        maxdist = IntegrationDistance({'default': 200})
+        attrs = set(vars(src))
+        box = maxdist.get_affected_box(src)
+        self.assertIs(maxdist.get_affected_box(src), box)  # cached
+        self.assertEqual(set(vars(src)), attrs)  # the source is untouched
+        # the cache is not pickled
+        self.assertEqual(len(pickle.loads(pickle.dumps(maxdist))._boxes), 0)
+
 
 class SourceFilterTestCase(unittest.TestCase):
 
@@ -18,10 +18,12 @@ import pickle
 import unittest
 import tempfile
 
+from unittest import mock
 import numpy
 from shapely import wkt
 
-from openquake.baselib import hdf5
+from openquake.baselib import hdf5, jit
+from openquake.hazardlib import site
 from openquake.hazardlib.site import Site, SiteCollection
 from openquake.hazardlib.geo.point import Point
 
@@ -264,6 +266,12 @@ class WithinBBoxTestCase(unittest.TestCase):
     def test1(self):
         assert_eq(self.sites.within_bbox((-182, -28, -178, -26)), [0])
 
+    @unittest.skipUnless(jit.available, 'numba is not installed')
+    def test_numba(self):
+        with mock.patch.object(site, 'NUMBA_MIN_SIZE', 1):
+            assert_eq(self.sites.within_bbox((-182, -28, -178, -26)), [0])
+            assert_eq(self.sites.within_bbox((178, -31, 181, -27)), [3, 4])
+
 
 class SiteCollectionIterTestCase(unittest.TestCase):
 
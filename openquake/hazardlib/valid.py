@@ -560,9 +560,14 @@ def positivefloats(value):
         string of whitespace separated floats
     :returns:
         a list of positive floats
+
+    >>> positivefloats('[0.1 0 2E-3]')
+    [0.1, 0.0, 0.002]
     """
-    values = value.strip('[]').split()
-    floats = list(map(positivefloat, values))
+    floats = list(map(float, value.strip('[]').split()))
+    for f in floats:
+        if f < 0:
+            raise ValueError('float %s < 0' % f)
     return floats
 
 
@@ -91,6 +91,36 @@ class CostCalculator(object):
         # this should never happen
         raise RuntimeError('Unable to compute cost')
 
+    def get_values(self, loss_type, costs, areas, numbers):
+        """
+        Vectorized version of the cost calculator.
+
+        :param loss_type: a loss type
+        :param costs: an array of costs, with NaNs for the missing ones
+        :param areas: an array of areas
+        :param numbers: an array of numbers
+        :returns: an array of values, with NaNs for the missing costs
+
+        >>> costs = numpy.array([10., numpy.nan])
+        >>> costcalculator.get_values('structural', costs, 2., 3.)
+        array([60., nan])
+        """
+        if numpy.isnan(costs).all():
+            return costs
+        cost_type = self.cost_types[loss_type]
+        if cost_type == "aggregated":
+            return costs
+        if cost_type == "per_asset":
+            return costs * numbers
+        if cost_type == "per_area":
+            area_type = self.area_types[loss_type]
+            if area_type == "aggregated":
+                return costs * areas
+            elif area_type == "per_asset":
+                return costs * areas * numbers
+        # this should never happen
+        raise RuntimeError('Unable to compute cost')
+
     def get_units(self, loss_types):
         """
         :param: a list of loss types
@@ -204,6 +234,7 @@ class Asset(object):
 U8 = numpy.uint8
 U32 = numpy.uint32
 F32 = numpy.float32
+F64 = numpy.float64
 U64 = numpy.uint64
 TWO32 = 2 ** 32
 by_taxonomy = operator.attrgetter('taxonomy')
@@ -409,12 +440,13 @@ class AssetCollection(object):
 
     def assets_by_site(self):
         """
-        :returns: numpy array of lists with the assets by each site
+        :returns: a list of arrays with the assets of each site
         """
-        assets_by_site = [[] for sid in range(self.tot_sites)]
-        for i, ass in enumerate(self.array):
-            assets_by_site[ass['site_id']].append(self[i])
-        return numpy.array(assets_by_site)
+        array = self.array
+        # a stable sort keeps the assets of each site in their original order
+        order = numpy.argsort(array['site_id'], kind='stable')
+        counts = numpy.bincount(array['site_id'], minlength=self.tot_sites)
+        return numpy.split(array[order], numpy.cumsum(counts)[:-1])
 
     def aggregate_by(self, tagnames, array):
         """
@@ -511,8 +543,7 @@ class AssetCollection(object):
         sitecol.make_complete()
 
     def __iter__(self):
-        for i in range(len(self)):
-            yield self[i]
+        return iter(self.array)
 
     def __getitem__(self, aid):
         return self.array[aid]
@@ -580,40 +611,45 @@ def build_asset_array(assets_by_site, tagnames=(), time_event=None):
         [('id', '<S20'), ('ordinal', U32), ('lon', F32), ('lat', F32),
          ('site_id', U32), ('number', F32), ('area', F32)] + [
              (str(name), float) for name in float_fields] + int_fields)
-    num_assets = sum(len(assets) for assets in assets_by_site)
-    assetcol = numpy.zeros(num_assets, asset_dt)
-    asset_ordinal = 0
-    fields = set(asset_dt.fields)
+    assets = []
+    sids = []
     for sid, assets_ in enumerate(assets_by_site):
         for asset in assets_:
-            asset.ordinal = asset_ordinal
-            record = assetcol[asset_ordinal]
-            asset_ordinal += 1
-            for field in fields:
-                if field == 'id':
-                    value = asset.asset_id
-                elif field == 'ordinal':
-                    value = asset.ordinal
-                elif field == 'number':
-                    value = asset.number
-                elif field == 'area':
-                    value = asset.area
-                elif field == 'site_id':
-                    value = sid
-                elif field == 'lon':
-                    value = asset.location[0]
-                elif field == 'lat':
-                    value = asset.location[1]
-                elif field.startswith('occupants_'):
-                    value = asset.values[field]
-                elif field == 'retrofitted':
-                    value = asset.retrofitted()
-                elif field in tagnames:
-                    value = asset.tagidxs[tagi[field]]
-                else:
-                    name, lt = field.split('-')
-                    value = asset.value(lt, time_event)
-                record[field] = value
+            asset.ordinal = len(assets)
+            assets.append(asset)
+            sids.append(sid)
+    # fill the array column by column
+    assetcol = numpy.zeros(len(assets), asset_dt)
+    assetcol['id'] = [asset.asset_id for asset in assets]
+    assetcol['ordinal'] = numpy.arange(len(assets))
+    assetcol['lon'] = [asset.location[0] for asset in assets]
+    assetcol['lat'] = [asset.location[1] for asset in assets]
+    assetcol['site_id'] = sids
+    assetcol['number'] = [asset.number for asset in assets]
+    assetcol['area'] = [asset.area for asset in assets]
+    calc = assets[0].calc
+    if all(asset.calc is calc for asset in assets):
+        # compute the values with the vectorized cost calculator
+        areas = numpy.array([asset.area for asset in assets], F64)
+        numbers = numpy.array([asset.number for asset in assets], F64)
+    else:
+        calc = None
+    for field in float_fields:
+        if field.startswith('occupants_'):
+            assetcol[field] = [asset.values[field] for asset in assets]
+        elif field == 'retrofitted':
+            assetcol[field] = [asset.retrofitted() for asset in assets]
+        elif calc:
+            name, lt = field.split('-')
+            costs = numpy.array([asset.values.get(lt) for asset in assets],
+                                F64)
+            assetcol[field] = calc.get_values(lt, costs, areas, numbers)
+        else:
+            name, lt = field.split('-')
+            assetcol[field] = [asset.value(lt, time_event)
+                               for asset in assets]
+    for field, i in tagi.items():
+        assetcol[field] = [asset.tagidxs[i] for asset in assets]
     return assetcol, ' '.join(occupancy_periods)
 
 
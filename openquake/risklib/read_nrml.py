@@ -396,7 +396,6 @@ def update_validators():
         'insuranceLimit': valid.positivefloat,
         'deductible': valid.positivefloat,
         'occupants': valid.positivefloat,
-        'value': valid.positivefloat,
         'retrofitted': valid.positivefloat,
         'number': valid.compose(valid.nonzero, valid.positivefloat),
         'vulnerabilitySetID': str,  # any ASCII string is fine
@@ -415,7 +414,6 @@ def update_validators():
         'minIML': valid.positivefloat,
         'maxIML': valid.positivefloat,
         'limitStates': valid.namelist,
-        'noDamageLimit': valid.NoneOr(valid.positivefloat),
         'loss_type': valid_loss_types,
         'losses': valid.positivefloats,
         'averageLoss': valid.positivefloat,
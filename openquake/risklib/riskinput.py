@@ -40,12 +40,14 @@ def get_assets_by_taxo(assets, tempname=None):
     assets_by_taxo.eps = {}
     if tempname is None:  # no epsilons
         return assets_by_taxo
-    # otherwise read the epsilons and group them by taxonomy
+    # otherwise read the epsilons and group them by taxonomy; h5py can
+    # read many rows in a single call only if the indices are increasing
+    ordinals = numpy.unique(assets['ordinal'])
     with hdf5.File(tempname, 'r') as h5:
-        dset = h5['epsilon_matrix']
-        for taxo, assets in assets_by_taxo.items():
-            lst = [dset[aid] for aid in assets['ordinal']]
-            assets_by_taxo.eps[taxo] = numpy.array(lst)
+        eps = h5['epsilon_matrix'][ordinals]
+    for taxo, assets in assets_by_taxo.items():
+        idxs = numpy.searchsorted(ordinals, assets['ordinal'])
+        assets_by_taxo.eps[taxo] = eps[idxs]
     return assets_by_taxo
 
 
@@ -81,15 +83,19 @@ def get_output(crmodel, assets_by_taxo, haz, rlzi=None):
                loss_types=crmodel.loss_types)
     if rlzi is not None:
         dic['rlzi'] = rlzi
+    # the epsilons and the risk models do not depend on the loss type
+    taxo_info = []
+    for taxonomy, assets_ in assets_by_taxo.items():
+        if len(assets_by_taxo.eps):
+            epsilons = assets_by_taxo.eps[taxonomy][:, eids]
+        else:  # no CoVs
+            epsilons = ()
+        rmodels, weights = crmodel.get_rmodels_weights(taxonomy)
+        taxo_info.append((assets_, epsilons, rmodels, weights))
     for l, lt in enumerate(crmodel.loss_types):
         ls = []
-        for taxonomy, assets_ in assets_by_taxo.items():
-            if len(assets_by_taxo.eps):
-                epsilons = assets_by_taxo.eps[taxonomy][:, eids]
-            else:  # no CoVs
-                epsilons = ()
+        for assets_, epsilons, rmodels, weights in taxo_info:
             arrays = []
-            rmodels, weights = crmodel.get_rmodels_weights(taxonomy)
             for rm in rmodels:
                 if len(data) == 0:
                     dat = [0]
@@ -101,7 +107,8 @@ def get_output(crmodel, assets_by_taxo, haz, rlzi=None):
             res = arrays[0] if len(arrays) == 1 else numpy.average(
                 arrays, weights=weights, axis=0)
             ls.append(res)
-        arr = numpy.concatenate(ls)
+        # with a single taxonomy there is nothing to concatenate
+        arr = numpy.asarray(ls[0]) if len(ls) == 1 else numpy.concatenate(ls)
         dic[lt] = arr[assets_by_taxo.idxs] if len(arr) else arr
     return hdf5.ArrayWrapper((), dic)
 
@@ -121,10 +128,7 @@ class RiskInput(object):
         self.hazard_getter = hazard_getter
         self.assets = assets
         self.weight = len(assets)
-        aids = []
-        for asset in self.assets:
-            aids.append(asset['ordinal'])
-        self.aids = numpy.array(aids, numpy.uint32)
+        self.aids = numpy.array(assets['ordinal'], U32)
 
     def gen_outputs(self, cr_model, monitor, tempname=None, haz=None):
         """
@@ -168,14 +172,14 @@ def make_eps(asset_array, num_samples, seed, correlation):
     :returns: epsilons matrix of shape (num_assets, num_samples)
     """
     assets_by_taxo = group_array(asset_array, 'taxonomy')
-    eps = numpy.zeros((len(asset_array), num_samples), numpy.float32)
+    eps = numpy.zeros((len(asset_array), num_samples), F32)
     for taxonomy, assets in assets_by_taxo.items():
         shape = (len(assets), num_samples)
         logging.info('Building %s epsilons for taxonomy %s', shape, taxonomy)
-        zeros = numpy.zeros(shape)
-        epsilons = scientific.make_epsilons(zeros, seed, correlation)
-        for asset, epsrow in zip(assets, epsilons):
-            eps[asset['ordinal']] = epsrow
+        # make_epsilons only looks at the shape of the matrix
+        matrix = numpy.empty(shape, F32)
+        epsilons = scientific.make_epsilons(matrix, seed, correlation)
+        eps[assets['ordinal']] = epsilons
     return eps
 
 
@@ -180,7 +180,7 @@ def rescale(curves, values):
     A, _, C = curves.shape
     assert A == len(values), (A, len(values))
     array = numpy.zeros((A, C), loss_poe_dt)
-    array['loss'] = [c * v for c, v in zip(curves[:, 0], values)]
+    array['loss'] = curves[:, 0] * numpy.asarray(values)[:, None]
     array['poe'] = curves[:, 1]
     return array
 
@@ -262,8 +262,9 @@ class RiskModel(object):
         lratios = self.loss_ratios[loss_type]
         imls = self.hazard_imtls[vf.imt]
         values = get_values(loss_type, assets)
-        lrcurves = numpy.array(
-            [scientific.classical(vf, imls, hazard_curve, lratios)] * n)
+        # the curve is the same for all assets: broadcast it without copies
+        curve = scientific.classical(vf, imls, hazard_curve, lratios)
+        lrcurves = numpy.broadcast_to(curve, (n,) + curve.shape)
         return rescale(lrcurves, values)
 
     def event_based_risk(self, loss_type, assets, gmvs, eids, epsilons):
@@ -323,14 +324,11 @@ class RiskModel(object):
         curves_retro = functools.partial(
             scientific.classical, vf_retro, imls,
             loss_ratios=self.loss_ratios_retro[loss_type])
-        original_loss_curves = numpy.array([curves_orig(hazard)] * n)
-        retrofitted_loss_curves = numpy.array([curves_retro(hazard)] * n)
-
-        eal_original = numpy.array([scientific.average_loss(lc)
-                                    for lc in original_loss_curves])
-
-        eal_retrofitted = numpy.array([scientific.average_loss(lc)
-                                       for lc in retrofitted_loss_curves])
+        # the curves are the same for all assets, so are the average losses
+        eal_original = numpy.full(
+            n, scientific.average_loss(curves_orig(hazard)))
+        eal_retrofitted = numpy.full(
+            n, scientific.average_loss(curves_retro(hazard)))
 
         bcr_results = [
             scientific.bcr(
@@ -595,12 +593,15 @@ class CompositeRiskModel(collections.abc.Mapping):
                        for lt, kind in rm.risk_functions
                        if kind in 'vulnerability fragility'}
         self.curve_params = self.make_curve_params(oqparam)
-        iml = collections.defaultdict(list)
-        for riskid, rm in self._riskmodels.items():
-            for lt, rf in rm.risk_functions.items():
+        # keep a running minimum instead of collecting all the imls
+        min_iml = {}
+        for rm in self._riskmodels.values():
+            for rf in rm.risk_functions.values():
                 if hasattr(rf, 'imt'):
-                    iml[rf.imt].append(rf.imls[0])
-        self.min_iml = {imt: min(iml[imt]) for imt in iml}
+                    val = rf.imls[0]
+                    cur = min_iml.get(rf.imt)
+                    min_iml[rf.imt] = val if cur is None or val < cur else cur
+        self.min_iml = min_iml
 
     def eid_dmg_dt(self):
         """
@@ -705,10 +706,10 @@ class CompositeRiskModel(collections.abc.Mapping):
         """
         :returns: a list of weighted risk models for the given taxonomy index
         """
-        rmodels, weights = [], []
-        for key, weight in self.tmap[taxidx]:
-            rmodels.append(self._riskmodels[key])
-            weights.append(weight)
+        pairs = self.tmap[taxidx]
+        riskmodels = self._riskmodels
+        rmodels = [riskmodels[key] for key, _weight in pairs]
+        weights = [weight for _key, weight in pairs]
         return rmodels, weights
 
     def __iter__(self):
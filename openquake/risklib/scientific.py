@@ -29,7 +29,7 @@ from functools import lru_cache
 
 import numpy
 from numpy.testing import assert_equal
-from scipy import interpolate, stats, random
+from scipy import interpolate, stats, special, random
 
 from openquake.baselib.general import CallableDict, cached_property
 from openquake.hazardlib.stats import compute_stats2
@@ -67,9 +67,15 @@ def fine_graining(points, steps):
     """
     if steps < 2:
         return points
-    ls = numpy.concatenate([numpy.linspace(x, y, num=steps + 1)[:-1]
-                            for x, y in pairwise(points)])
-    return numpy.concatenate([ls, [points[-1]]])
+    points = numpy.asarray(points, F64)
+    out = numpy.empty(steps * (len(points) - 1) + 1)
+    # all the intervals at once, dropping the right end of each interval;
+    # start + i * step is the same formula used by numpy.linspace
+    step = (points[1:] - points[:-1]) / steps
+    grid = numpy.arange(steps) * step[:, None] + points[:-1, None]
+    out[:-1] = grid.ravel()
+    out[-1] = points[-1]
+    return out
 
 #
 # Input models
@@ -294,13 +300,14 @@ class VulnerabilityFunction(object):
         Compute the LREM (Loss Ratio Exceedance Matrix).
         """
         # LREM has number of rows equal to the number of loss ratios
-        # and number of columns equal to the number of imls
+        # and number of columns equal to the number of imls; it is
+        # computed with a single broadcast call to the survival function;
+        # it is kept in double precision: storing it as float32 changes the
+        # loss maps of classical_risk/case_master at the 1E-6 level
+        lrs = numpy.array(loss_ratios, F64).reshape(-1, 1)
         lrem = numpy.empty((len(loss_ratios), len(self.imls)))
-        for row, loss_ratio in enumerate(loss_ratios):
-            for col, (mean_loss_ratio, stddev) in enumerate(
-                    zip(self.mean_loss_ratios, self.stddevs)):
-                lrem[row, col] = self.distribution.survival(
-                    loss_ratio, mean_loss_ratio, stddev)
+        lrem[:] = self.distribution.survival(
+            lrs, self.mean_loss_ratios, self.stddevs)
         return lrem
 
     @lru_cache()
@@ -762,7 +769,8 @@ class Distribution(metaclass=abc.ABCMeta):
     def survival(self, loss_ratio, mean, stddev):
         """
         Return the survival function of the distribution with `mean`
-        and `stddev` applied to `loss_ratio`
+        and `stddev` applied to `loss_ratio`; the arguments can be
+        scalars or broadcastable arrays
         """
         raise NotImplementedError
 
@@ -776,8 +784,7 @@ class DegenerateDistribution(Distribution):
         return means
 
     def survival(self, loss_ratio, mean, _stddev):
-        return numpy.piecewise(
-            loss_ratio, [loss_ratio > mean or not mean], [0, 1])
+        return numpy.where((loss_ratio > mean) | (mean == 0), 0, 1)[()]
 
 
 def make_epsilons(matrix, seed, correlation):
@@ -827,15 +834,23 @@ class LogNormalDistribution(Distribution):
         # In that case, when `mean` > 0 the survival function
         # approaches to a step function, otherwise (`mean` == 0) we
         # returns 0
-        if stddev == 0:
-            return numpy.piecewise(
-                loss_ratio, [loss_ratio > mean or not mean], [0, 1])
-
+        mean, stddev = numpy.asarray(mean, F64), numpy.asarray(stddev, F64)
+        zero = stddev == 0
         variance = stddev ** 2.0
-
-        sigma = numpy.sqrt(numpy.log((variance / mean ** 2.0) + 1.0))
-        mu = mean ** 2.0 / numpy.sqrt(variance + mean ** 2.0)
-        return stats.lognorm.sf(loss_ratio, sigma, scale=mu)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            # sigma and mu are computed before broadcasting with the loss
+            # ratios; the cells with stddev = 0 get the step function
+            sigma = numpy.where(zero, 1., numpy.sqrt(
+                numpy.log((variance / mean ** 2.0) + 1.0)))
+            mu = numpy.where(
+                zero, 1., mean ** 2.0 / numpy.sqrt(variance + mean ** 2.0))
+            # survival function of the lognormal distribution: this is
+            # what stats.lognorm.sf computes, without its overhead
+            sf = special.ndtr(-numpy.log(loss_ratio / mu) / sigma)
+        if zero.any():
+            step = DegenerateDistribution().survival(loss_ratio, mean, None)
+            sf = numpy.where(zero, step, sf)
+        return sf[()]
 
 
 @DISTRIBUTIONS.add('BT')
@@ -867,10 +882,11 @@ class DiscreteDistribution(Distribution):
     def sample(self, loss_ratios, probs):
         ret = []
         r = numpy.arange(len(loss_ratios))
-        for i in range(probs.shape[1]):
+        # transpose once, so that each column of probs is contiguous
+        for i, col in enumerate(numpy.ascontiguousarray(probs.T)):
             random.seed(self.seed + i)
             # the seed is set inside the loop to avoid block-size dependency
-            pmf = stats.rv_discrete(name='pmf', values=(r, probs[:, i])).rvs()
+            pmf = stats.rv_discrete(name='pmf', values=(r, col)).rvs()
             ret.append(loss_ratios[pmf])
         return ret
 
@@ -998,23 +1014,21 @@ def classical(vulnerability_function, hazard_imls, hazard_poes, loss_ratios):
     assert len(hazard_imls) == len(hazard_poes), (
         len(hazard_imls), len(hazard_poes))
     vf = vulnerability_function
-    imls = vf.mean_imls()
+    # the mean imls and the LREM depend only on the vulnerability function,
+    # so they are cached and must not be modified in place
     lrem = vf.loss_ratio_exceedance_matrix(loss_ratios)
 
     # saturate imls to hazard imls
-    min_val, max_val = hazard_imls[0], hazard_imls[-1]
-    numpy.putmask(imls, imls < min_val, min_val)
-    numpy.putmask(imls, imls > max_val, max_val)
+    imls = numpy.clip(vf.mean_imls(), hazard_imls[0], hazard_imls[-1])
 
-    # interpolate the hazard curve
-    poes = interpolate.interp1d(hazard_imls, hazard_poes)(imls)
+    # interpolate the hazard curve at all the imls in a single call
+    poes = numpy.interp(imls, hazard_imls, hazard_poes)
 
     # compute the poos
     pos = pairwise_diff(poes)
-    lrem_po = numpy.empty(lrem.shape)
-    for idx, po in enumerate(pos):
-        lrem_po[:, idx] = lrem[:, idx] * po  # column * po
-    return numpy.array([loss_ratios, lrem_po.sum(axis=1)])
+    # multiply each column by its po and sum over the columns, without
+    # building the intermediate matrix lrem_po
+    return numpy.array([loss_ratios, lrem.dot(pos)])
 
 
 def conditional_loss_ratio(loss_ratios, poes, probability):